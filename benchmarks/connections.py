@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Count the TCP connections opened for 100 page fetches, with one-off
+`requests.get` calls (the old behavior) and with the shared session used by
+`gradescope.api.request`. The rate limit is lifted so that only connection
+reuse is measured.
+
+Run from the repository root:
+
+    python benchmarks/connections.py
+"""
+import http.server
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, ".")
+
+import gradescope.api  # noqa: E402
+
+NUM_REQUESTS = 100
+
+
+class CountingServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b"<html><body>ok</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(label, fetch, server, url):
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(NUM_REQUESTS):
+        fetch(url)
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>4} connections  {:>7.1f} ms".format(
+        label, server.connections, elapsed * 1000))
+
+
+def main():
+    server = CountingServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{}/account".format(server.server_address[1])
+
+    # Skip the login round-trip: the local server does not check cookies
+    gradescope.api.last_cookies = {}
+    gradescope.api.configure_rate_limit(rate=0)
+
+    print("{} requests to {}".format(NUM_REQUESTS, url))
+    run("requests.get (before)", requests.get, server, url)
+    run("shared session (after)", lambda u: gradescope.api.request(url=u), server, url)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+End-to-end export throughput: run `fetch_courses`, `fetch_assignments` and
+`save_assignments` from main.py against the local fake Gradescope server
+(`fake_gradescope.py`), into a temporary directory, and report
+assignments/sec, p50/p99 response times for each kind of page the export
+requests, the wall time of each step and the peak RSS. The client's rate
+limit is lifted unless `--rate` is given, so the numbers are not capped at
+its default of 50 requests per second.
+
+Run from the repository root; every fake server flag is accepted:
+
+    python benchmarks/export.py --jobs 8 --latency-ms 50 --courses 10
+"""
+import argparse
+import contextlib
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, ".")
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fake_gradescope  # noqa: E402
+import gradescope  # noqa: E402
+import gradescope.api  # noqa: E402
+import gradescope.metrics  # noqa: E402
+import gradescope.session_file  # noqa: E402
+import main  # noqa: E402
+
+# kind of request, by path
+STAGES = [
+    ("login", r"/|/login"),
+    ("account", r"/account"),
+    ("assignments", r"/courses/\d+/assignments"),
+    ("edit", r"/courses/\d+/assignments/\d+/edit"),
+    ("outline", r"/courses/\d+/assignments/\d+/outline/edit"),
+    ("image", r"/files/.*"),
+    ("template", r"/templates/.*"),
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ResponseTimes:
+    """Collects the time to each response of the shared session, by stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_stage = {}
+        self.patterns = [(name, re.compile(pattern)) for name, pattern in STAGES]
+
+    def stage(self, url):
+        path = urllib.parse.urlparse(url).path.rstrip("/") or "/"
+        for name, pattern in self.patterns:
+            if pattern.fullmatch(path):
+                return name
+        return "other"
+
+    def hook(self, response, *args, **kwargs):
+        with self.lock:
+            self.by_stage.setdefault(self.stage(response.url), []).append(
+                response.elapsed.total_seconds())
+
+
+@contextlib.contextmanager
+def quiet():
+    """Send stdout (of this process and the renderers it starts) to /dev/null"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def max_rss_mib(who):
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run(args):
+    process, url = fake_gradescope.start(fake_gradescope.settings_from_args(args))
+    workdir = tempfile.mkdtemp(prefix="gradescope-bench-")
+
+    gradescope.api.BASE_URL = url
+    gradescope.session_file.SESSION_FILE = os.path.join(workdir, "session.json")
+    gradescope.config.update(username="bench@example.edu", password="bench")
+    main.TARGET_DIR = os.path.join(workdir, "target")
+    os.makedirs(main.TARGET_DIR)
+
+    gradescope.api.configure_rate_limit(rate=args.rate)
+
+    times = ResponseTimes()
+    gradescope.api.get_session().hooks["response"].append(times.hook)
+
+    steps = [
+        ("fetch_courses", main.fetch_courses),
+        ("fetch_assignments", main.fetch_assignments),
+        ("save_assignments", lambda: main.save_assignments(
+            jobs=args.jobs, render_jobs=args.render_jobs)),
+    ]
+    step_times = []
+    try:
+        for name, step in steps:
+            start = time.perf_counter()
+            if args.verbose:
+                step()
+            else:
+                with quiet():
+                    step()
+            step_times.append((name, time.perf_counter() - start))
+        with main.open_state() as state:
+            counts = state.counts()
+        children_rss = max_rss_mib(resource.RUSAGE_CHILDREN)
+    finally:
+        process.terminate()
+
+    num_assignments = sum(counts.values())
+    total = sum(elapsed for _, elapsed in step_times)
+    save_time = step_times[-1][1]
+
+    print(f"output in {workdir}")
+    print(f"{num_assignments} assignments: "
+          + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    print(f"{num_assignments / save_time:.2f} assignments/s saving, "
+          f"{num_assignments / total:.2f} assignments/s end to end")
+    print()
+    print("{:<20} {:>10}".format("step", "seconds"))
+    for name, elapsed in step_times:
+        print("{:<20} {:>10.2f}".format(name, elapsed))
+    print()
+    print("{:<20} {:>10} {:>10} {:>10}".format("responses", "count", "p50 ms", "p99 ms"))
+    for name in [name for name, _ in STAGES] + ["other"]:
+        values = times.by_stage.get(name)
+        if values:
+            print("{:<20} {:>10} {:>10.1f} {:>10.1f}".format(
+                name, len(values),
+                percentile(values, 0.50) * 1000, percentile(values, 0.99) * 1000))
+    print()
+    print("{:<20} {:>10} {:>10}".format("phases", "calls", "seconds"))
+    for name, stats in gradescope.metrics.snapshot()["phases"].items():
+        print("{:<20} {:>10} {:>10.2f}".format(name, stats["calls"], stats["seconds"]))
+    throttled = [counter for counter in gradescope.metrics.snapshot()["counters"]
+                 if counter["name"] in ("throttled", "retries")]
+    if throttled:
+        print()
+        for counter in throttled:
+            labels = ",".join(f"{k}={v}" for k, v in counter["labels"].items())
+            print("{:<31} {:>10.0f}".format(f"{counter['name']} {labels}", counter["value"]))
+    print()
+    print(f"peak RSS {max_rss_mib(resource.RUSAGE_SELF):.0f} MiB, "
+          f"largest renderer process {children_rss:.0f} MiB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time a full export against a local fake Gradescope server")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="assignments fetched concurrently")
+    parser.add_argument("--render-jobs", type=int,
+                        help="rendering processes (default: one per cpu)")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="client requests per second (default: 0, no limit)")
+    parser.add_argument("--verbose", action="store_true",
+                        help="show the output of the export steps")
+    fake_gradescope.add_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_args())
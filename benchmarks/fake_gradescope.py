@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the parts of Gradescope the exporter reads, serving the
+synthetic pages from `pages.py`: the login form, `account`, the assignment
+tree, each assignment's `edit` and `outline/edit` pages, `/files/` images,
+template and submission pdfs, the scores and roster CSVs and the
+evaluations export.
+
+Every response waits `latency` seconds first, and the number of courses,
+assignments, questions, images, students and the payload sizes are all
+configurable. Every assignment id `template_every` has a template pdf to
+download; every `programming_every` is a programming assignment; the rest are
+generated from their outline.
+
+With `max_in_flight`, requests beyond that many at once are throttled the
+way Gradescope does it: a 429 with a `Retry-After` of `retry_after` seconds.
+
+Run it on its own (and point `gradescope.api.BASE_URL` at it) with:
+
+    python benchmarks/fake_gradescope.py --port 8000 --latency-ms 50
+"""
+import argparse
+import dataclasses
+import functools
+import http.server
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pages  # noqa: E402
+
+SESSION_COOKIE = "_gradescope_session"
+TOKEN_COOKIE = "signed_token"
+
+
+@dataclasses.dataclass
+class Settings:
+    latency: float = 0.0
+    num_courses: int = 4
+    assignments_per_course: int = 25
+    template_every: int = 3
+    programming_every: int = 10
+    num_questions: int = 20
+    text_size: int = 2000
+    images_per_question: int = 1
+    image_size: int = 64
+    pdf_size: int = 256 * 1024
+    num_students: int = 200
+    max_in_flight: int = 0
+    retry_after: float = 1.0
+
+
+class FakeGradescope:
+    """The responses, by path; each one is built once and reused"""
+
+    routes = [
+        ("GET", r"/", "home"),
+        ("GET", r"/login", "login_page"),
+        ("POST", r"/login", "login"),
+        ("GET", r"/account", "account"),
+        ("GET", r"/courses/(\d+)/assignments", "assignments"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/edit", "edit"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/outline/edit", "outline"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/scores\.csv", "scores"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/review_grades", "review_grades"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/export_evaluations", "evaluations"),
+        ("GET", r"/courses/(\d+)/assignments/(\d+)/submissions/(\d+)\.pdf", "submission"),
+        ("GET", r"/courses/(\d+)/memberships\.csv", "roster"),
+        ("POST", r"/courses/(\d+)/memberships/many", "invite_many"),
+        ("GET", r"/files/([\w.-]+)\.png", "image"),
+        ("GET", r"/templates/(\d+)\.pdf", "template"),
+    ]
+
+    # pages that can be read without logging in
+    public = {"home", "login_page", "login"}
+
+    def __init__(self, settings, base_url):
+        self.settings = settings
+        # template links point off the site, so they are absolute
+        self.base_url = base_url
+        self.compiled = [
+            (method, re.compile(pattern + "/?"), name)
+            for method, pattern, name in self.routes
+        ]
+
+    def route(self, method, path):
+        for route_method, pattern, name in self.compiled:
+            if route_method == method:
+                match = pattern.fullmatch(path)
+                if match:
+                    return name, match.groups()
+        return None, ()
+
+    def assignment_kind(self, assignment_id):
+        index = int(assignment_id) % 1000
+        if self.settings.programming_every and index % self.settings.programming_every == 0:
+            return "programming"
+        if self.settings.template_every and index % self.settings.template_every == 0:
+            return "template"
+        return "outline"
+
+    def home(self):
+        return "text/html", pages.home_page()
+
+    def login_page(self):
+        return "text/html", pages.home_page()
+
+    def account(self):
+        return "text/html", pages.account_page(num_courses=self.settings.num_courses)
+
+    @functools.lru_cache(maxsize=None)
+    def assignments(self, course_id):
+        return "text/html", pages.assignments_page(
+            num_courses=self.settings.num_courses,
+            assignments_per_course=self.settings.assignments_per_course,
+        )
+
+    def edit(self, course_id, assignment_id):
+        href = None
+        if self.assignment_kind(assignment_id) == "template":
+            href = f"{self.base_url}/templates/{assignment_id}.pdf"
+        return "text/html", pages.edit_page(href)
+
+    @functools.lru_cache(maxsize=1024)
+    def outline(self, course_id, assignment_id):
+        assignment_type = "Assignment"
+        if self.assignment_kind(assignment_id) == "programming":
+            assignment_type = "ProgrammingAssignment"
+        return "text/html", pages.outline_page(
+            title=f"Homework {assignment_id}",
+            num_questions=self.settings.num_questions,
+            text_size=self.settings.text_size,
+            images_per_question=self.settings.images_per_question,
+            image_prefix=f"{assignment_id}_",
+            assignment_type=assignment_type,
+        )
+
+    @functools.lru_cache(maxsize=1024)
+    def scores(self, course_id, assignment_id):
+        return "text/csv", pages.scores_csv(
+            num_students=self.settings.num_students,
+            num_questions=self.settings.num_questions,
+        )
+
+    @functools.lru_cache(maxsize=64)
+    def evaluations(self, course_id, assignment_id):
+        return "application/zip", pages.evaluations_zip(
+            num_students=self.settings.num_students,
+            num_questions=self.settings.num_questions,
+        )
+
+    def review_grades(self, course_id, assignment_id):
+        return "text/html", pages.review_grades_page(
+            num_submissions=self.settings.num_students)
+
+    @functools.lru_cache(maxsize=None)
+    def roster(self, course_id):
+        return "text/csv", pages.roster_csv(num_students=self.settings.num_students)
+
+    def invite_many(self, course_id):
+        return "application/json", b"{}"
+
+    @functools.lru_cache(maxsize=None)
+    def _image_padding(self):
+        return os.urandom(self.settings.image_size * 1024)
+
+    def image(self, name):
+        # a 1x1 png, padded to the payload size with a private chunk readers skip
+        return "image/png", _png(name.encode() + self._image_padding())
+
+    @functools.lru_cache(maxsize=None)
+    def _pdf_body(self):
+        body = b"%PDF-1.4\n"
+        body += b"%" + b"x" * max(self.settings.pdf_size - 20, 0) + b"\n"
+        return body + b"%%EOF\n"
+
+    def template(self, assignment_id):
+        return "application/pdf", self._pdf_body()
+
+    def submission(self, course_id, assignment_id, submission_id):
+        return "application/pdf", self._pdf_body()
+
+
+def _png(padding):
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+    pixels = zlib.compress(b"\x00\xff")
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"ppAd", padding)
+        + chunk(b"IDAT", pixels)
+        + chunk(b"IEND", b"")
+    )
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def handle_request(self, method):
+        app = self.server.app
+        path = urllib.parse.urlparse(self.path).path
+
+        if method == "POST":
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if not self.server.enter():
+            return self.respond(429, "text/plain", b"slow down", headers=[
+                ("Retry-After", f"{app.settings.retry_after:g}")])
+        try:
+            time.sleep(app.settings.latency)
+            self.dispatch(app, method, path)
+        finally:
+            self.server.leave()
+
+    def dispatch(self, app, method, path):
+        name, args = app.route(method, path)
+        if name is None:
+            return self.respond(404, "text/plain", b"not found")
+
+        if name == "login":
+            return self.respond(302, "text/html", b"", headers=[
+                ("Location", "/account"),
+                ("Set-Cookie", f"{SESSION_COOKIE}=session; Path=/; HttpOnly"),
+                ("Set-Cookie", f"{TOKEN_COOKIE}=token; Path=/; HttpOnly"),
+            ])
+
+        if name not in app.public and TOKEN_COOKIE not in (self.headers.get("Cookie") or ""):
+            return self.respond(302, "text/html", b"", headers=[("Location", "/login")])
+
+        content_type, body = getattr(app, name)(*args)
+        self.respond(200, content_type, body)
+
+    def respond(self, status, content_type, body, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, settings):
+        super().__init__(address, Handler)
+        self.app = FakeGradescope(settings, self.url)
+        self.in_flight = 0
+        self.in_flight_lock = threading.Lock()
+
+    def enter(self):
+        """Count a request in, unless that would be more than max_in_flight"""
+        with self.in_flight_lock:
+            limit = self.app.settings.max_in_flight
+            if limit and self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.in_flight_lock:
+            self.in_flight -= 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def _serve(settings, port, urls):
+    server = Server(("127.0.0.1", port), settings)
+    urls.put(server.url)
+    server.serve_forever()
+
+
+def start(settings=None, port=0):
+    """
+    Serve in a separate process, so the server does not compete with the
+    code being measured for the GIL. Returns (process, base url).
+    """
+    context = multiprocessing.get_context("spawn")
+    urls = context.Queue()
+    process = context.Process(
+        target=_serve, args=(settings or Settings(), port, urls), daemon=True)
+    process.start()
+    return process, urls.get(timeout=30)
+
+
+def add_arguments(parser):
+    """Add a flag for every `Settings` field to an argparse parser"""
+    defaults = Settings()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency * 1000,
+                        help="delay before every response")
+    parser.add_argument("--courses", type=int, default=defaults.num_courses)
+    parser.add_argument("--assignments-per-course", type=int,
+                        default=defaults.assignments_per_course)
+    parser.add_argument("--template-every", type=int, default=defaults.template_every,
+                        help="every Nth assignment has a template pdf")
+    parser.add_argument("--programming-every", type=int,
+                        default=defaults.programming_every,
+                        help="every Nth assignment is a programming assignment")
+    parser.add_argument("--questions", type=int, default=defaults.num_questions)
+    parser.add_argument("--text-size", type=int, default=defaults.text_size,
+                        help="characters of text per question")
+    parser.add_argument("--images-per-question", type=int,
+                        default=defaults.images_per_question)
+    parser.add_argument("--image-kb", type=int, default=defaults.image_size)
+    parser.add_argument("--pdf-kb", type=int, default=defaults.pdf_size // 1024)
+    parser.add_argument("--students", type=int, default=defaults.num_students)
+    parser.add_argument("--max-in-flight", type=int, default=defaults.max_in_flight,
+                        help="answer 429 to requests beyond this many at once (0: never)")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after,
+                        help="seconds in the Retry-After of a 429")
+
+
+def settings_from_args(args):
+    return Settings(
+        latency=args.latency_ms / 1000,
+        num_courses=args.courses,
+        assignments_per_course=args.assignments_per_course,
+        template_every=args.template_every,
+        programming_every=args.programming_every,
+        num_questions=args.questions,
+        text_size=args.text_size,
+        images_per_question=args.images_per_question,
+        image_size=args.image_kb,
+        pdf_size=args.pdf_kb * 1024,
+        num_students=args.students,
+        max_in_flight=args.max_in_flight,
+        retry_after=args.retry_after,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = Server(("127.0.0.1", args.port), settings_from_args(args))
+    print(f"serving on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Per-document cost of setting up fonts, parsing all five custom fonts for
+every pdf (the old PDFWithCustomFonts) versus the shared, lazily added fonts.
+
+Run from the repository root:
+
+    python benchmarks/fonts.py
+"""
+import logging
+import sys
+import timeit
+
+from fpdf import FPDF
+
+sys.path.insert(0, ".")
+
+import main  # noqa: E402
+
+# fontTools logs a line per subset font
+logging.getLogger("fontTools").setLevel(logging.ERROR)
+
+NUMBER = 20
+
+
+def eager_fonts():
+    pdf = FPDF()
+    for (family, style), filename in main.CUSTOM_FONTS.items():
+        pdf.add_font(family, style, filename)
+    return pdf
+
+
+def use_fonts(pdf):
+    # the faces a typical question-based pdf uses
+    pdf.add_page()
+    for family, style in [
+        ("CMU Serif", "B"),
+        ("Latin Modern Roman", ""),
+        ("Latin Modern Mono", ""),
+    ]:
+        pdf.set_font(family, style, 12)
+        pdf.write(text="The quick brown fox jumps over the lazy dog. ")
+    return pdf
+
+
+def ms_per_doc(fn):
+    return min(timeit.repeat(fn, number=NUMBER, repeat=3)) / NUMBER * 1000
+
+
+def run():
+    # parse the shared fonts before timing
+    use_fonts(main.PDFWithCustomFonts())
+
+    print("{:<28} {:>12} {:>12}".format("", "before ms", "after ms"))
+    print("{:<28} {:>12.2f} {:>12.2f}".format(
+        "construct",
+        ms_per_doc(eager_fonts),
+        ms_per_doc(main.PDFWithCustomFonts),
+    ))
+    print("{:<28} {:>12.2f} {:>12.2f}".format(
+        "construct + write + output",
+        ms_per_doc(lambda: use_fonts(eager_fonts()).output()),
+        ms_per_doc(lambda: use_fonts(main.PDFWithCustomFonts()).output()),
+    ))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Memory and time to read a large scores.csv into grade records: the dicts of
+`parse_csv` + `collapse_grades` + `to_numeric` (what `get_assignment_grades`
+returns) against the `__slots__` records of `gradescope.records`
+(`get_assignment_grades(..., compact=True)`).
+
+Run from the repository root:
+
+    python benchmarks/grades.py [--students 2000] [--questions 50]
+"""
+import argparse
+import gc
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, ".")
+sys.path.insert(0, os.path.dirname(__file__))
+
+import gradescope.records  # noqa: E402
+import gradescope.util  # noqa: E402
+import pages  # noqa: E402
+
+
+def dict_records(content):
+    grades = gradescope.util.collapse_grades(gradescope.util.parse_csv(content))
+    gradescope.util.to_numeric(grades, ("Total Score", "Max Points", "View Count"))
+    return grades
+
+
+def compact_records(content):
+    return list(gradescope.records.read_grade_records(
+        gradescope.util.iter_lines([content])))
+
+
+def measure(parse, content):
+    """(ms per parse, MiB held by the result, peak MiB while parsing)"""
+    seconds = min(timeit.repeat(lambda: parse(content), number=1, repeat=5))
+
+    gc.collect()
+    tracemalloc.start()
+    result = parse(content)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return seconds * 1000, held / 2**20, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare grade record memory and time")
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=50)
+    args = parser.parse_args()
+
+    content = pages.scores_csv(num_students=args.students, num_questions=args.questions)
+    assert [r.to_dict() for r in compact_records(content)] == dict_records(content)
+
+    print(f"{args.students} students x {args.questions} questions, "
+          f"{len(content) / 2**20:.1f} MiB of CSV")
+    print("{:<10} {:>10} {:>12} {:>12}".format("records", "ms", "held MiB", "peak MiB"))
+    for name, parse in [("dicts", dict_records), ("compact", compact_records)]:
+        print("{:<10} {:>10.1f} {:>12.2f} {:>12.2f}".format(name, *measure(parse, content)))
+
+
+if __name__ == "__main__":
+    main()
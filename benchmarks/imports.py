@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Startup cost of importing parts of the package in a fresh interpreter, as a
+short-lived worker process would: the median wall time over several runs,
+less the time of an interpreter that imports nothing, and the modules loaded.
+
+Runs in an empty directory, so no config.yaml is found; importing must not
+need one.
+
+Run from the repository root:
+
+    python benchmarks/imports.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STATEMENTS = [
+    "import gradescope",
+    "import gradescope.util",
+    "from gradescope.util import parse_csv",
+    "import gradescope.records",
+    "import gradescope.api",
+    "import gradescope.macros",
+    # a top-level method pulls in the scrapers on first use
+    "import gradescope; gradescope.get_courses",
+]
+
+COUNT_MODULES = "; import sys; print(len(sys.modules))"
+
+
+def run(code, cwd, env):
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env,
+        check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, int(out.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time importing the gradescope package")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.path.abspath("."))
+    cwd = tempfile.mkdtemp(prefix="gradescope-imports-")
+
+    def measure(code):
+        run(code, cwd, env)  # warm the bytecode and OS caches
+        results = [run(code, cwd, env) for _ in range(args.runs)]
+        return statistics.median(t for t, _ in results), results[0][1]
+
+    baseline, baseline_modules = measure("pass" + COUNT_MODULES)
+
+    print(f"empty interpreter: {baseline * 1000:.1f} ms, {baseline_modules} modules")
+    print("{:<45} {:>10} {:>10}".format("statement", "ms", "modules"))
+    for statement in STATEMENTS:
+        seconds, modules = measure(statement + COUNT_MODULES)
+        print("{:<45} {:>10.1f} {:>10}".format(
+            statement, (seconds - baseline) * 1000, modules - baseline_modules))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Synthetic Gradescope pages shaped like the real ones the scrapers read.
+
+Sizes are configurable so benchmarks can model large courses. Names are
+not all ASCII, and like many real pages these have no <meta charset>, so a
+parser that guesses the encoding shows up as a mismatch.
+"""
+import csv
+import html
+import io
+import json
+import zipfile
+
+
+def _page(body):
+    # Real pages carry a lot of markup around the part we read
+    chrome = "".join(
+        f'<li class="nav-item"><a href="/help/{i}">Help topic {i}</a></li>'
+        for i in range(200)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Gradescope</title></head><body>"
+        f'<nav><ul class="nav">{chrome}</ul></nav>'
+        f'<main id="main-content">{body}</main>'
+        "</body></html>"
+    ).encode()
+
+
+def home_page():
+    return _page(
+        '<form action="/login" method="post">'
+        '<input type="hidden" name="authenticity_token" value="token">'
+        "</form>"
+    )
+
+
+def account_page(num_courses=20):
+    boxes = "".join(
+        f'<a class="courseBox" href="/courses/{1000 + i}">'
+        f'<h3 class="courseBox--shortname">CS {100 + i}</h3>'
+        f'<div class="courseBox--name">Cálculo número {i} – Straße</div></a>'
+        for i in range(num_courses)
+    )
+    return _page(f'<div class="courseList">{boxes}</div>')
+
+
+def assignments_page(num_courses=20, assignments_per_course=40):
+    rows = []
+    for i in range(num_courses):
+        course_id = 1000 + i
+        assignment_rows = "".join(
+            f'<li class="js-assignmentRow"><button data-assignment-id="{course_id * 1000 + j}">'
+            f"Übung {j}: naïve façade</button></li>"
+            for j in range(assignments_per_course)
+        )
+        rows.append(
+            f'<li class="js-courseRow"><button id="course-{course_id}">toggle</button>'
+            f'<div class="type-heading">CS {100 + i}</div><ul>{assignment_rows}</ul></li>'
+        )
+    return _page(f'<ul class="treeSelector">{"".join(rows)}</ul>')
+
+
+def review_grades_page(num_submissions=1000):
+    rows = "".join(
+        f'<tr><td><a href="/courses/1000/assignments/1/submissions/{5000 + i}">'
+        f"Zoë Ångström-Nguyễn {i}</a></td><td>student{i}@example.edu</td>"
+        f"<td>{i % 10}</td></tr>"
+        for i in range(num_submissions)
+    )
+    return _page(f'<table class="js-reviewGradesTable">{rows}</table>')
+
+
+def outline(num_questions=30, text_size=2000, images_per_question=0,
+            image_prefix="", assignment_type="Assignment"):
+    questions = {}
+    for i in range(num_questions):
+        text = ("Question text with `inline code` and prose. " * (text_size // 45))
+        text += "".join(
+            f"\n![figure](/files/{image_prefix}{i}_{j}.png)" for j in range(images_per_question)
+        )
+        questions[str(i + 1)] = {
+            "id": i + 1,
+            "index": i + 1,
+            "parent_id": None,
+            "title": f"Question {i + 1}",
+            "content": [{"type": "text", "value": text}],
+        }
+    return {"assignment": {"type": assignment_type}, "questions": questions}
+
+
+def outline_page(title="Homework", **outline_args):
+    props = html.escape(json.dumps(outline(**outline_args)), quote=True)
+    return _page(
+        f'<h2 class="sidebar--title" title="{html.escape(title)}">{html.escape(title)}</h2>'
+        f'<div data-react-class="AssignmentOutline" data-react-props="{props}"></div>'
+    )
+
+
+def edit_page(href=None):
+    link = f'<a class="tiiBtn" href="{href}">Download PDF</a>' if href else ""
+    return _page(f'<form><div class="fileUpload">{link}</div></form>')
+
+
+def scores_csv(num_students=200, num_questions=20):
+    """An assignment's scores.csv; every 7th student has no submission"""
+    out = io.StringIO()
+    header = [
+        "Name", "SID", "Email", "Total Score", "Max Points", "Status",
+        "Submission ID", "Submission Time", "Lateness (H:M:S)", "View Count",
+    ] + [f"{i + 1}: Question {i + 1} (2.0 pts)" for i in range(num_questions)]
+    out.write(",".join(f'"{column}"' for column in header) + "\n")
+    for student in range(num_students):
+        graded = student % 7 != 0
+        question_scores = [
+            str((student + i) % 3) if graded else "" for i in range(num_questions)
+        ]
+        total = sum(float(score) for score in question_scores if score)
+        row = [
+            f"Student {student}", f"s{student}", f"student{student}@example.edu",
+            str(total) if graded else "", str(2.0 * num_questions),
+            "Graded" if graded else "Missing",
+            str(5000 + student) if graded else "",
+            "2020-01-01 12:00:00 -0500" if graded else "",
+            "00:00:00", str(student % 4),
+        ] + question_scores
+        out.write(",".join(f'"{value}"' for value in row) + "\n")
+    return out.getvalue().encode()
+
+
+def roster_csv(num_students=200):
+    out = io.StringIO()
+    out.write('"Full Name","Email","Role","SID","Submissions"\n')
+    for student in range(num_students):
+        out.write(
+            f'"Student {student}","student{student}@example.edu",'
+            f'"Student","s{student}","{student % 5}"\n'
+        )
+    return out.getvalue().encode()
+
+
+RUBRIC_ITEMS = ["Correct", "Minor error", "Incorrect"]
+
+
+def evaluations_zip(num_students=200, num_questions=20):
+    """An assignment's export_evaluations zip, matching scores_csv"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i in range(num_questions):
+            out = io.StringIO()
+            writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+            writer.writerow(
+                ["Assignment Submission ID", "Question Submission ID", "Name", "SID",
+                 "Email", "Score", "Grader"] + RUBRIC_ITEMS
+                + ["Adjustment", "Comments", "Tags", "Submission Time"])
+            for student in range(num_students):
+                if student % 7 == 0:
+                    continue
+                score = (student + i) % 3
+                writer.writerow(
+                    [5000 + student, 90000 + student * num_questions + i,
+                     f"Student {student}", f"s{student}",
+                     f"student{student}@example.edu", score, "Grader"]
+                    + ["true" if score == 2 - j else "false" for j in range(3)]
+                    + ["0.0", "Looks good,\nsee the rubric" if score else "", "",
+                       "2020-01-01 12:00:00 -0500"])
+            zf.writestr(f"assignment_export/{i + 1}_Question_{i + 1}.csv", out.getvalue())
+    return buffer.getvalue()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Time the `gradescope.macros` page parsers on large pages with each parser
+backend, against the way every scraper used to work: a full `html.parser`
+tree of the decoded page, with no partial parsing or attribute fast path.
+
+Pages are synthetic unless a directory of recorded pages is given, with any
+of account.html, assignments.html, review_grades.html, outline.html and
+edit.html in it:
+
+    python benchmarks/parsing.py [RECORDED_PAGES_DIR]
+"""
+import os
+import sys
+import timeit
+
+import bs4
+
+sys.path.insert(0, ".")
+sys.path.insert(0, os.path.dirname(__file__))
+
+import gradescope.macros  # noqa: E402
+import gradescope.parsing  # noqa: E402
+import pages  # noqa: E402
+
+PARSERS = [
+    ("account.html", lambda c: gradescope.macros.parse_courses(c)),
+    ("assignments.html", lambda c: gradescope.macros.parse_assignments(c, [])),
+    ("review_grades.html", gradescope.macros.parse_assignment_submissions),
+    ("outline.html", gradescope.macros.parse_assignment_data),
+    ("edit.html", gradescope.macros.parse_assignment_template_href),
+]
+
+
+def load_pages(directory=None):
+    synthetic = {
+        "account.html": pages.account_page(num_courses=200),
+        "assignments.html": pages.assignments_page(
+            num_courses=50, assignments_per_course=80),
+        "review_grades.html": pages.review_grades_page(num_submissions=2000),
+        "outline.html": pages.outline_page(num_questions=60),
+        "edit.html": pages.edit_page("https://example.com/template.pdf"),
+    }
+    if directory is None:
+        return synthetic
+
+    recorded = {}
+    for name in synthetic:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                recorded[name] = f.read()
+    return recorded
+
+
+def best_of(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1000
+
+
+def legacy(parse, content):
+    """Run parse with the old full-tree html.parser behavior"""
+    parser = gradescope.parsing.PARSER
+    make_soup = gradescope.parsing.make_soup
+    find_tag_attribute = gradescope.parsing.find_tag_attribute
+
+    gradescope.parsing.set_parser("html.parser")
+    gradescope.parsing.make_soup = lambda c, parse_only=None: bs4.BeautifulSoup(
+        c.decode(), features="html.parser")
+    gradescope.parsing.find_tag_attribute = lambda *args, **kwargs: None
+    try:
+        return parse(content)
+    finally:
+        gradescope.parsing.set_parser(parser)
+        gradescope.parsing.make_soup = make_soup
+        gradescope.parsing.find_tag_attribute = find_tag_attribute
+
+
+def main():
+    content_by_name = load_pages(sys.argv[1] if len(sys.argv) > 1 else None)
+    backends = list(gradescope.parsing.PARSERS)
+
+    print("{:<20} {:>8} {:>14}".format("page", "KiB", "before ms")
+          + "".join("{:>16}".format(b + " ms") for b in backends))
+
+    for name, parse in PARSERS:
+        if name not in content_by_name:
+            continue
+        content = content_by_name[name]
+        number = 3
+
+        row = "{:<20} {:>8.0f} {:>14.2f}".format(
+            name, len(content) / 1024,
+            best_of(lambda: legacy(parse, content), number))
+
+        for backend in backends:
+            gradescope.parsing.set_parser(backend)
+            assert parse(content) == legacy(parse, content)
+            row += "{:>16.2f}".format(best_of(lambda: parse(content), number))
+
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Time (or profile) the page parsers in `gradescope.macros` and
+`write_markup_to_pdf` on the real pages of a recorded cassette, with no
+network. Record one with `python main.py --record gradescope.cassette`
+(and the export steps enabled), then:
+
+    python benchmarks/replay.py gradescope.cassette [--profile]
+
+Every page is parsed `--number` times and the best time is reported, so runs
+are comparable between changes.
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import re
+import sys
+import tempfile
+import timeit
+import urllib.parse
+
+sys.path.insert(0, ".")
+
+import gradescope.api  # noqa: E402
+import gradescope.macros  # noqa: E402
+import main  # noqa: E402
+
+# page kind, url pattern, parser
+PAGES = [
+    ("account", r"/account$", gradescope.macros.parse_courses),
+    ("assignments", r"/courses/\d+/assignments/?$",
+     lambda content: gradescope.macros.parse_assignments(content, [])),
+    ("review_grades", r"/review_grades$", gradescope.macros.parse_assignment_submissions),
+    ("outline", r"/outline/edit$", gradescope.macros.parse_assignment_data),
+    ("edit", r"/assignments/\d+/edit$", gradescope.macros.parse_assignment_template_href),
+]
+
+
+def recorded_pages(cassette):
+    """(kind, url, parser) of every recorded page we know how to parse"""
+    for url in cassette.urls():
+        for kind, pattern, parse in PAGES:
+            if re.search(pattern, url):
+                yield kind, url, parse
+                break
+
+
+def best_ms(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1000
+
+
+def run(args):
+    cassette = gradescope.api.enable_cassette(args.cassette, "replay")
+    # relative requests (images) go to wherever the cassette was recorded
+    recorded = urllib.parse.urlparse(cassette.urls()[0])
+    gradescope.api.BASE_URL = f"{recorded.scheme}://{recorded.netloc}"
+    workdir = tempfile.mkdtemp(prefix="gradescope-replay-")
+    main.TARGET_DIR = workdir
+
+    parse_ms = {}
+    outlines = []
+    for kind, url, parse in recorded_pages(cassette):
+        content = gradescope.api.request(url=url).content
+        parse_ms.setdefault(kind, []).append(best_ms(lambda: parse(content), args.number))
+        if kind == "outline":
+            data = parse(content)
+            if data["assignment"]["type"] != "ProgrammingAssignment" and data.get("questions"):
+                outlines.append(data)
+
+    def render_all():
+        for i, data in enumerate(outlines):
+            main.write_markup_to_pdf(data, os.path.join(workdir, f"{i}.pdf"))
+
+    print("{:<16} {:>8} {:>12} {:>12}".format("page", "count", "mean ms", "max ms"))
+    for kind, values in parse_ms.items():
+        print("{:<16} {:>8} {:>12.2f} {:>12.2f}".format(
+            kind, len(values), sum(values) / len(values), max(values)))
+
+    # the first render parses the fonts and fills the image cache
+    render_all()
+    if outlines:
+        print("{:<16} {:>8} {:>12.2f}".format(
+            "render", len(outlines), best_ms(render_all, 1) / len(outlines)))
+
+    if args.profile:
+        profile = cProfile.Profile()
+        profile.enable()
+        for kind, url, parse in recorded_pages(cassette):
+            parse(gradescope.api.request(url=url).content)
+        render_all()
+        profile.disable()
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(args.profile_lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Time parsing and rendering on the pages of a cassette")
+    parser.add_argument("cassette", help="a cassette recorded with main.py --record")
+    parser.add_argument("--number", type=int, default=5,
+                        help="times each page is parsed per measurement")
+    parser.add_argument("--profile", action="store_true",
+                        help="also print a cProfile of parsing and rendering everything once")
+    parser.add_argument("--profile-lines", type=int, default=30)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,224 @@
+"""
+SQLite record of what an export has done so far.
+
+One row per course and per assignment. Each assignment row holds the outcome
+of its last save (pending, downloaded, generated, programming, exists or
+failed), the output file with its size and sha256, the fingerprint of the outline a
+generated pdf was made from, and the last error, so a re-run can plan the
+remaining work with one indexed query instead of probing every assignment
+over the network.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PENDING = "pending"
+FAILED = "failed"
+
+# outcomes that leave an output file behind
+COMPLETED = ("downloaded", "generated", "exists")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    id TEXT PRIMARY KEY,
+    code TEXT,
+    name TEXT,
+    updated_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS assignments (
+    course_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    name TEXT,
+    course_code TEXT,
+    href TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    output TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    fingerprint TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL,
+    PRIMARY KEY (course_id, id)
+);
+
+CREATE INDEX IF NOT EXISTS assignments_by_status ON assignments (status);
+"""
+
+ASSIGNMENT_COLUMNS = ("id", "name", "course_id", "course_code", "href")
+
+# columns added since the first schema, added to older databases on open
+ADDED_COLUMNS = {"fingerprint": "TEXT"}
+
+
+class ExportState:
+    """Thread-safe wrapper around the export's sqlite database"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(SCHEMA)
+            columns = {
+                row["name"]
+                for row in self.db.execute("PRAGMA table_info(assignments)")
+            }
+            for name, kind in ADDED_COLUMNS.items():
+                if name not in columns:
+                    self.db.execute(f"ALTER TABLE assignments ADD COLUMN {name} {kind}")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_courses(self, courses):
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO courses (id, code, name, updated_at) "
+                "VALUES (:id, :code, :name, :updated_at) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "code = excluded.code, name = excluded.name, "
+                "updated_at = excluded.updated_at",
+                [course | {"updated_at": now} for course in courses],
+            )
+
+    def add_assignments(self, assignments):
+        """Record assignments as pending, keeping the status of known ones"""
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT INTO assignments "
+                "(id, name, course_id, course_code, href, updated_at) "
+                "VALUES (:id, :name, :course_id, :course_code, :href, :updated_at) "
+                "ON CONFLICT (course_id, id) DO UPDATE SET "
+                "name = excluded.name, course_code = excluded.course_code, "
+                "href = excluded.href",
+                [
+                    {k: assignment.get(k) for k in ASSIGNMENT_COLUMNS}
+                    | {"updated_at": now}
+                    for assignment in assignments
+                ],
+            )
+
+    def planned(self, only_failed=False, sync=False, output_filename=None):
+        """The assignments still to save: pending and failed, or only failed
+
+        Unless only_failed, completed assignments whose output file has gone
+        missing are included as well (rows without a recorded output are
+        looked for at `output_filename(course_id, id)`). With sync, generated
+        pdfs with a recorded fingerprint are included too, to be checked
+        against their current outline."""
+        statuses = (FAILED,) if only_failed else (PENDING, FAILED)
+        where = f"status IN ({', '.join('?' * len(statuses))})"
+        if sync and not only_failed:
+            where += " OR fingerprint IS NOT NULL"
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, name, course_id, course_code, href FROM assignments "
+                f"WHERE {where} ORDER BY course_id, id",
+                statuses,
+            ).fetchall()
+            completed = [] if only_failed else self.db.execute(
+                "SELECT id, name, course_id, course_code, href, output FROM assignments "
+                f"WHERE status IN ({', '.join('?' * len(COMPLETED))}) "
+                "AND NOT (? AND fingerprint IS NOT NULL)",
+                COMPLETED + (sync,),
+            ).fetchall()
+
+        planned = [dict(row) for row in rows]
+        for row in completed:
+            output = row["output"]
+            if output is None and output_filename is not None:
+                output = output_filename(row["course_id"], row["id"])
+            if output is not None and not os.path.exists(output):
+                planned.append({k: row[k] for k in ASSIGNMENT_COLUMNS})
+        planned.sort(key=lambda row: (row["course_id"], row["id"]))
+        return planned
+
+    def record(self, course_id, assignment_id, status, output=None, size=None,
+               sha256=None, fingerprint=None, error=None):
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE assignments SET status = ?, output = ?, size = ?, "
+                "sha256 = ?, fingerprint = ?, error = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE course_id = ? AND id = ?",
+                (status, output, size, sha256, fingerprint, error, time.time(),
+                 course_id, assignment_id),
+            )
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT status, COUNT(*) FROM assignments GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def verify(self, jobs=1, output_filename=None):
+        """
+        Re-hash the output of every completed assignment in parallel. Outputs
+        that are missing or don't match their recorded hash are removed and
+        marked pending again. Rows recorded without an output (by older
+        versions) are checked at `output_filename(course_id, id)`.
+        """
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT course_id, id, output, size, sha256 FROM assignments "
+                f"WHERE status IN ({', '.join('?' * len(COMPLETED))})",
+                COMPLETED,
+            ).fetchall()
+
+        rows = [dict(row) for row in rows]
+        for row in rows:
+            if row["output"] is None and output_filename is not None:
+                row["output"] = output_filename(row["course_id"], row["id"])
+        rows = [row for row in rows if row["output"] is not None]
+
+        def is_intact(row):
+            if not os.path.exists(row["output"]):
+                return False
+            if row["size"] is not None and os.path.getsize(row["output"]) != row["size"]:
+                return False
+            if row["size"] is None:
+                # recorded before sizes were: a complete pdf ends with %%EOF
+                with open(row["output"], "rb") as f:
+                    f.seek(max(0, os.path.getsize(row["output"]) - 1024))
+                    return b"%%EOF" in f.read()
+            if row["sha256"] is None:
+                return True
+            digest = hashlib.sha256()
+            with open(row["output"], "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return digest.hexdigest() == row["sha256"]
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            intact = list(pool.map(is_intact, rows))
+
+        broken = [row for row, ok in zip(rows, intact) if not ok]
+        for row in broken:
+            for filename in (row["output"], row["output"] + ".meta.json"):
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+        with self.lock, self.db:
+            self.db.executemany(
+                "UPDATE assignments SET status = 'pending', output = NULL, "
+                "size = NULL, sha256 = NULL, fingerprint = NULL "
+                "WHERE course_id = ? AND id = ?",
+                [(row["course_id"], row["id"]) for row in broken],
+            )
+        return broken
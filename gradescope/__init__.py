@@ -19,21 +19,47 @@ from __future__ import absolute_import
 from gradescope.version import __version__
 
 # Configuration file
-
+#
+# Nothing is read (and `confuse` is not imported) until a value is needed:
+# `config["username"]` resolves the configuration on the first login, so
+# importing the package, or a helper module like `gradescope.util`, needs no
+# credentials file. Values set with `config.update(...)` take precedence and
+# never touch the file.
+
+import importlib as _importlib
 import os as _os
-import confuse as _confuse
+
+try:
+    from collections.abc import MutableMapping as _MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping as _MutableMapping
 
 APPNAME = "gradescope"
 
-class GradescopeConfiguration(_confuse.LazyConfig):
+SECTION_NAME = "gradescope"
+
+TEMPLATE = {
+    SECTION_NAME: {
+        "username": str,
+        "password": str,
+    },
+}
+
+
+def _configuration_class():
+    import confuse as _confuse
+
+    class GradescopeConfiguration(_confuse.LazyConfig):
+
+        def config_dir(self):
 
-    def config_dir(self):
+            local_config = _os.path.join(_os.getcwd(), _confuse.CONFIG_FILENAME)
+            if _os.path.exists(local_config):
+                return _os.getcwd()
 
-        local_config = _os.path.join(_os.getcwd(), _confuse.CONFIG_FILENAME)
-        if _os.path.exists(local_config):
-            return _os.getcwd()
+            return super(GradescopeConfiguration, self).config_dir()
 
-        return super(GradescopeConfiguration, self).config_dir()
+    return GradescopeConfiguration
 
 
 class GradescopeConfigurationException(Exception):
@@ -51,9 +77,10 @@ class GradescopeConfigurationException(Exception):
         super(GradescopeConfigurationException, self).__init__(msg)
 
 
-config = GradescopeConfiguration(APPNAME, __name__)
-
 def get_local_config(section, template):
+    import confuse as _confuse
+
+    config = _configuration_class()(APPNAME, __name__)
 
     try:
         valid = config.get(template)
@@ -66,17 +93,82 @@ def get_local_config(section, template):
 
     return valid[section]
 
-SECTION_NAME = "gradescope"
 
-config = get_local_config(
-    section=SECTION_NAME,
-    template={
-        SECTION_NAME: {
-            "username": str,
-            "password": str,
-        },
-    })
+class LazyConfiguration(_MutableMapping):
+    """
+    The `gradescope` section of the configuration file, read and validated
+    the first time a value that was not set explicitly is looked up.
+    """
+
+    def __init__(self, section, template):
+        self.section = section
+        self.template = template
+        self._values = None
+        self._overrides = {}
+
+    def resolve(self):
+        """Read and validate the configuration file, once."""
+        if self._values is None:
+            self._values = dict(get_local_config(
+                section=self.section, template=self.template))
+        return self._values
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        return self.resolve()[key]
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = value
+
+    def __delitem__(self, key):
+        del self._overrides[key]
+
+    def __iter__(self):
+        return iter(set(self.resolve()) | set(self._overrides))
+
+    def __len__(self):
+        return len(set(self.resolve()) | set(self._overrides))
+
+    def __repr__(self):
+        state = "resolved" if self._values is not None else "not resolved"
+        return "<LazyConfiguration [{}] {}>".format(self.section, state)
+
+
+config = LazyConfiguration(SECTION_NAME, TEMPLATE)
+
+
+# Submodules, and the top-level methods of `gradescope.macros`, are imported
+# on first use
+
+_SUBMODULES = {
+    "aio", "api", "cache", "cassette", "exceptions", "gradebook", "macros",
+    "metrics", "parsing", "ratelimit", "raw_util", "records", "session_file",
+    "util", "version",
+}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return _importlib.import_module("gradescope." + name)
+
+    if name == "GradescopeConfiguration":
+        return _configuration_class()
+
+    if not name.startswith("_"):
+        macros = _importlib.import_module("gradescope.macros")
+        try:
+            value = getattr(macros, name)
+        except AttributeError:
+            pass
+        else:
+            globals()[name] = value
+            return value
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
-# Import top-level methods
-from gradescope.macros import *
\ No newline at end of file
+def __dir__():
+    macros = _importlib.import_module("gradescope.macros")
+    return sorted(set(globals()) | _SUBMODULES | {
+        name for name in dir(macros) if not name.startswith("_")})
@@ -0,0 +1,294 @@
+"""
+asyncio counterparts of `gradescope.api.request` and the `gradescope.macros`
+scrapers, built on an httpx client with HTTP/2 multiplexing.
+
+HTML parsing runs in a worker thread so it never blocks the event loop.
+
+    import asyncio
+    import gradescope.aio
+
+    async def main():
+        courses = await gradescope.aio.get_courses()
+        assignments = await gradescope.aio.get_assignments(
+            [course["id"] for course in courses])
+        await gradescope.aio.aclose()
+
+    asyncio.run(main())
+"""
+
+from __future__ import absolute_import
+
+import asyncio as _asyncio
+import typing as _typing
+
+try:
+    import httpx as _httpx
+except ImportError:  # pragma: no cover
+    raise RuntimeError(
+        """
+        The asyncio client requires the `httpx` library with HTTP/2 support.
+
+        => You can install it with `pip` or `uv`:
+                pip install --user "httpx[http2]"
+           or
+                uv add "httpx[http2]"
+        """)
+
+import six as _six
+
+import gradescope
+import gradescope.api
+import gradescope.exceptions
+import gradescope.macros
+import gradescope.metrics
+import gradescope.session_file
+
+
+# Connection limits for the shared client; with HTTP/2 many requests are
+# multiplexed over each connection
+MAX_CONNECTIONS = 16
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+last_cookies = None
+
+_client = None
+_login_lock = None
+
+
+def get_client():
+    # type: () -> _httpx.AsyncClient
+    """
+    Return the shared async client, creating it on first use.
+    """
+    global _client
+
+    if _client is None:
+        _client = _httpx.AsyncClient(
+            http2=True,
+            # Connection-specific headers are not allowed over HTTP/2
+            headers={
+                name: value
+                for name, value in gradescope.api.DEFAULT_HEADERS.items()
+                if name != "Connection"
+            },
+            # redirects, including the trailing-slash 301s, are followed here;
+            # a redirect to the login page shows in the final url
+            follow_redirects=True,
+            limits=_httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=None,
+        )
+
+    return _client
+
+
+async def aclose():
+    # type: () -> None
+    """
+    Close the shared client and forget its login.
+    """
+    global _client, _login_lock, last_cookies
+
+    if _client is not None:
+        await _client.aclose()
+
+    _client = None
+    _login_lock = None
+    last_cookies = None
+
+
+async def get_auth_cookies(username=None, password=None, **kwargs):
+    # type: (_typing.Optional[str], _typing.Optional[str], _typing.Dict) -> _typing.Optional[dict]
+    global last_cookies
+
+    client = get_client()
+
+    # Step 1: Get an "authenticity token" and start the Gradescope session
+
+    try:
+        response = await client.get(gradescope.api.BASE_URL)
+    except _httpx.HTTPError:
+        return
+
+    authenticity_token = await _asyncio.to_thread(
+        gradescope.api.parse_authenticity_token, response.content)
+
+    # Step 2: Login with credentials and get signed token
+
+    url = _six.moves.urllib.parse.urljoin(
+        base=gradescope.api.BASE_URL,
+        url="login",
+    )
+
+    try:
+        response = await client.post(
+            url=url,
+            follow_redirects=False,
+            headers={
+                "Origin": gradescope.api.BASE_URL,
+                "Content-Type": "application/x-www-form-urlencoded",
+            },
+            data=gradescope.api.login_form(authenticity_token, username, password),
+        )
+    except _httpx.HTTPError:
+        return
+
+    # Step 3: Inspect cookies to make sure we are logged in
+
+    if response.status_code in [200, 302]:
+        cookies = response.cookies
+
+        if "_gradescope_session" in cookies and "signed_token" in cookies:
+            data = {
+                "authenticity_token": authenticity_token,
+                "_gradescope_session": cookies["_gradescope_session"],
+                "signed_token": cookies["signed_token"],
+                "cookies": cookies,
+                "username": username or gradescope.config["username"],
+            }
+            last_cookies = data
+            return data
+
+
+def load_session(username=None):
+    # type: (_typing.Optional[str]) -> _typing.Optional[dict]
+    """
+    Reuse the login saved by an earlier run; see `gradescope.api.load_session`.
+    """
+    global last_cookies
+
+    username = username or gradescope.config["username"]
+    saved = gradescope.session_file.load(username)
+    if saved is None:
+        return
+
+    client = get_client()
+    gradescope.session_file.restore_cookies(client.cookies, saved["cookies"])
+
+    last_cookies = {
+        "authenticity_token": saved["authenticity_token"],
+        "cookies": client.cookies,
+        "username": username,
+        "saved_cookies": saved["cookies"],
+    }
+    return last_cookies
+
+
+async def login(**kwargs):
+    # type: (dict) -> _typing.Optional[dict]
+    global _login_lock
+
+    # Only one coroutine logs in; the others wait and reuse its cookies
+    if _login_lock is None:
+        _login_lock = _asyncio.Lock()
+
+    async with _login_lock:
+        with gradescope.metrics.phase("login"):
+            if last_cookies is None and load_session(kwargs.get("username")) is None:
+                if await get_auth_cookies(**kwargs) is not None:
+                    records = gradescope.session_file.cookie_records(
+                        get_client().cookies.jar)
+                    gradescope.session_file.save(
+                        last_cookies["username"], last_cookies, records)
+                    last_cookies["saved_cookies"] = records
+
+    return last_cookies
+
+
+def invalidate_login(stale):
+    # type: (_typing.Optional[dict]) -> None
+    global last_cookies
+
+    if last_cookies is not stale:
+        return
+
+    last_cookies = None
+    get_client().cookies.clear()
+    gradescope.session_file.clear(
+        cookies=stale.get("saved_cookies") if stale else None)
+
+
+async def request(endpoint=None, url=None, data=None, json=None, relogin=True, **kwargs):
+    # type: (_typing.Optional[str], _typing.Optional[str], _typing.Optional[_typing.Union[str, dict]], _typing.Optional[dict], bool, dict) -> _httpx.Response
+    """
+    Make a request to Gradescope from a coroutine; see `gradescope.api.request`.
+    """
+
+    if last_cookies is None:
+        await login(**kwargs)
+
+    current_login = last_cookies
+
+    # If only endpoint was passed, augment with base URL
+    if endpoint is not None:
+        url = _six.moves.urllib.parse.urljoin(
+            base=gradescope.api.BASE_URL,
+            url=endpoint,
+        )
+
+    client = get_client()
+
+    with gradescope.metrics.phase("http"):
+        if data is None and json is None:
+            res = await client.get(url=url)
+
+        elif json is not None:
+            res = await client.post(url=url, json=json)
+
+        else:
+            res = await client.post(url=url, data=data)
+
+    gradescope.metrics.count("requests", method=res.request.method, status=res.status_code)
+    gradescope.metrics.count("bytes_received", len(res.content), source="network")
+
+    if relogin and gradescope.api.login_required(res):
+        invalidate_login(current_login)
+        gradescope.metrics.count("retries", reason="relogin")
+        return await request(url=url, data=data, json=json, relogin=False, **kwargs)
+
+    gradescope.exceptions.handle_api_error(res)
+
+    return res
+
+
+async def _parse(parser, *args):
+    # Parsing is CPU-bound, keep it off the event loop
+    return await _asyncio.to_thread(parser, *args)
+
+
+async def get_courses():
+    response = await request(endpoint="account")
+    return await _parse(gradescope.macros.parse_courses, response.content)
+
+
+async def get_assignments(course_ids):
+    response = await request(
+        endpoint=gradescope.macros.assignments_endpoint(course_ids))
+    return await _parse(
+        gradescope.macros.parse_assignments, response.content, course_ids)
+
+
+async def get_assignment_submissions(course_id, assignment_id, **kwargs):
+    endpoint = f"courses/{course_id}/assignments/{assignment_id}/review_grades"
+    response = await request(endpoint=endpoint)
+    return await _parse(
+        gradescope.macros.parse_assignment_submissions, response.content)
+
+
+async def get_image(path):
+    return await request(endpoint=path)
+
+
+async def get_data_from_assignment(course_id, assignment_id):
+    endpoint = f"courses/{course_id}/assignments/{assignment_id}/outline/edit"
+    response = await request(endpoint=endpoint)
+    return await _parse(gradescope.macros.parse_assignment_data, response.content)
+
+
+async def get_assignment_template_href(course_id, assignment_id):
+    endpoint = f"courses/{course_id}/assignments/{assignment_id}/edit"
+    response = await request(endpoint=endpoint)
+    return await _parse(
+        gradescope.macros.parse_assignment_template_href, response.content)
@@ -1,29 +1,265 @@
 
 from __future__ import absolute_import
 
+import atexit as _atexit
 import json as _json
+import threading as _threading
 import typing as _typing
 
-import bs4 as _bs4
 import requests as _requests
 import six as _six
 import wsse.client.requests.auth as _wsse_auth
 
 import gradescope
+import gradescope.cache
+import gradescope.cassette
 import gradescope.exceptions
+import gradescope.metrics
+import gradescope.parsing
+import gradescope.ratelimit
+import gradescope.session_file
 
 
 BASE_URL = "https://www.gradescope.com"
 
+USER_AGENT = ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/77.0.3865.120 Safari/537.36")
+
+DEFAULT_HEADERS = {
+    "Connection": "keep-alive",
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": USER_AGENT,
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-User": "?1",
+    "Accept": "text/html,application/xhtml+xml,application/xml",
+    "Sec-Fetch-Site": "same-origin",
+    "Referer": BASE_URL,
+}
+
+# Connection pool limits for the shared session; see `configure_session`
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 32
+
+# Bytes read at a time from a streamed response; see `iter_body`
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 last_cookies = None
 
+_session = None
+_cache = None
+_cassette = None
+_cassette_atexit_registered = False
+_limiter = gradescope.ratelimit.RateLimiter()
+_session_lock = _threading.Lock()
+_login_lock = _threading.Lock()
+
+
+def _build_session(pool_connections, pool_maxsize):
+    # type: (int, int) -> _requests.Session
+    session = _requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+
+    pool_kwargs = dict(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=True,
+    )
+    if _cassette is None:
+        adapter = _requests.adapters.HTTPAdapter(**pool_kwargs)
+    else:
+        adapter = _cassette.adapter(**pool_kwargs)
+
+    # a replay never reaches Gradescope, so there is nothing to throttle
+    if _cassette is None or not _cassette.replaying:
+        adapter = gradescope.ratelimit.LimitedAdapter(adapter, _limiter)
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_session():
+    # type: () -> _requests.Session
+    """
+    Return the process-wide session shared by every request, so that
+    connections (and the login cookies) are reused instead of renegotiated.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(POOL_CONNECTIONS, POOL_MAXSIZE)
+
+    return _session
+
+
+def configure_session(pool_connections=None, pool_maxsize=None):
+    # type: (_typing.Optional[int], _typing.Optional[int]) -> _requests.Session
+    """
+    Resize the connection pool of the shared session. Cookies of the current
+    session are carried over to the new one. A pool larger than the rate
+    limiter's `max_concurrency` raises that cap to match, so more workers
+    can actually have requests in flight.
+    """
+    global _session, POOL_CONNECTIONS, POOL_MAXSIZE
+
+    with _session_lock:
+        if pool_connections is not None:
+            POOL_CONNECTIONS = pool_connections
+        if pool_maxsize is not None:
+            POOL_MAXSIZE = pool_maxsize
+            if pool_maxsize > _limiter.max_concurrency:
+                _limiter.max_concurrency = pool_maxsize
+
+        old_session = _session
+        _session = _build_session(POOL_CONNECTIONS, POOL_MAXSIZE)
+
+        if old_session is not None:
+            _session.cookies.update(old_session.cookies)
+            old_session.close()
+
+    return _session
+
+
+def configure_rate_limit(rate=None, burst=None, max_concurrency=None, initial_concurrency=None):
+    # type: (_typing.Optional[float], _typing.Optional[int], _typing.Optional[int], _typing.Optional[int]) -> gradescope.ratelimit.RateLimiter
+    """
+    Replace the limiter shared by every request of the session: at most
+    `rate` requests per second (0 for no limit) in bursts of `burst`, and
+    an adaptive concurrency limit starting at `initial_concurrency` that
+    never exceeds `max_concurrency`; see `gradescope.ratelimit`.
+    """
+    global _limiter
+
+    _limiter = gradescope.ratelimit.RateLimiter(
+        rate=rate if rate is not None else _limiter.rate,
+        burst=burst if burst is not None else _limiter.burst,
+        max_concurrency=max_concurrency if max_concurrency is not None else _limiter.max_concurrency,
+        initial_concurrency=(initial_concurrency if initial_concurrency is not None
+                             else int(_limiter.concurrency)),
+    )
+    configure_session()
+    return _limiter
+
+
+def enable_cache(directory, max_bytes=gradescope.cache.DEFAULT_MAX_BYTES, ttls=None):
+    # type: (str, int, _typing.Optional[_typing.List[_typing.Tuple[str, float]]]) -> gradescope.cache.ResponseCache
+    """
+    Cache GET responses on disk in `directory`; see `gradescope.cache`.
+    """
+    global _cache
+
+    _cache = gradescope.cache.ResponseCache(directory, max_bytes=max_bytes, ttls=ttls)
+    return _cache
+
+
+def disable_cache():
+    # type: () -> None
+    global _cache
+
+    _cache = None
+
+
+def enable_cassette(filename, mode):
+    # type: (str, str) -> gradescope.cassette.Cassette
+    """
+    Record all traffic of the shared session to the cassette `filename`, or
+    replay it from there with no network (`mode` is "record" or "replay");
+    see `gradescope.cassette`. Replaying never logs in.
+    """
+    global _cassette, _cassette_atexit_registered
+
+    disable_cassette()
+    _cassette = gradescope.cassette.Cassette(filename, mode)
+    configure_session()
+
+    # finish the recording even if the caller never disables it
+    if not _cassette_atexit_registered:
+        _atexit.register(disable_cassette)
+        _cassette_atexit_registered = True
+    return _cassette
+
+
+def disable_cassette():
+    # type: () -> None
+    """
+    Stop recording or replaying. A recorded cassette is only complete (and
+    readable) once this has been called.
+    """
+    global _cassette
+
+    if _cassette is None:
+        return
+
+    cassette, _cassette = _cassette, None
+    cassette.close()
+    configure_session()
+
+
+def _cached_get(session, url):
+    # type: (_requests.Session, str) -> _requests.Response
+    cache = _cache
+    ttl = cache.ttl(url) if cache is not None else None
+
+    if ttl is None:
+        return session.get(url=url)
+
+    identity = last_cookies.get("username") if last_cookies else None
+    key = cache.key(url, identity)
+    entry = cache.get(key)
+
+    if entry is None:
+        res = session.get(url=url)
+
+    else:
+        meta, body = entry
+        if cache.is_fresh(meta, ttl):
+            return cache.to_response(meta, body)
+
+        # Stale: ask the server whether our copy is still good
+        res = session.get(url=url, headers=cache.conditional_headers(meta))
+        if res.status_code == 304:
+            cache.touch(key, meta)
+            return cache.to_response(meta, body)
+
+    if res.status_code == 200 and not login_required(res):
+        cache.put(key, res)
+
+    return res
+
+
+def parse_authenticity_token(content):
+    # type: (bytes) -> str
+    soup = gradescope.parsing.make_soup(
+        content,
+        parse_only=gradescope.parsing.strainer("input", name="authenticity_token"))
+    return soup.find("input", {"name": "authenticity_token"}).get("value")
+
+
+def login_form(authenticity_token, username=None, password=None):
+    # type: (str, _typing.Optional[str], _typing.Optional[str]) -> dict
+    return {
+        "utf8": "✓",
+        "authenticity_token": authenticity_token,
+        "session[email]": username or gradescope.config["username"],
+        "session[password]": password or gradescope.config["password"],
+        "session[remember_me]": "0,1",
+        "commit": "Log+In",
+        "session[remember_me_sso]": "0",
+    }
+
 
 def get_auth_cookies(username=None, password=None, **kwargs):
     # type: (_typing.Optional[str], _typing.Optional[str], _typing.Dict) -> _typing.Optional[dict]
     global last_cookies
 
-    session = _requests.sessions.session()
+    session = get_session()
 
     # Step 1: Get an "authenticity token" and start the Gradescope session
 
@@ -32,8 +268,7 @@ def get_auth_cookies(username=None, password=None, **kwargs):
     except _requests.RequestException:
         return
 
-    soup = _bs4.BeautifulSoup(response.content, features="html.parser")
-    authenticity_token = soup.find("input", {"name": "authenticity_token"}).get("value")
+    authenticity_token = parse_authenticity_token(response.content)
 
     # Step 2: Login with credentials and get signed token
 
@@ -47,30 +282,10 @@ def get_auth_cookies(username=None, password=None, **kwargs):
             url=url,
             allow_redirects=False,
             headers={
-                "Connection": "keep-alive",
-                "Pragma": "no-cache",
-                "Cache-Control": "no-cache",
                 "Origin": BASE_URL,
-                "Upgrade-Insecure-Requests": "1",
                 "Content-Type": "application/x-www-form-urlencoded",
-                "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) "
-                               "AppleWebKit/537.36 (KHTML, like Gecko) "
-                               "Chrome/77.0.3865.120 Safari/537.36"),
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-User": "?1",
-                "Accept": "text/html,application/xhtml+xml,application/xml",
-                "Sec-Fetch-Site": "same-origin",
-                "Referer": BASE_URL,
-            },
-            data={
-                "utf8": "✓",
-                "authenticity_token": authenticity_token,
-                "session[email]": username or gradescope.config["username"],
-                "session[password]": password or gradescope.config["password"],
-                "session[remember_me]": "0,1",
-                "commit": "Log+In",
-                "session[remember_me_sso]": "0",
             },
+            data=login_form(authenticity_token, username, password),
         )
     except _requests.RequestException:
         return
@@ -90,20 +305,139 @@ def get_auth_cookies(username=None, password=None, **kwargs):
                 "_gradescope_session": cookies["_gradescope_session"],
                 "signed_token": cookies["signed_token"],
                 "cookies": cookies,
-                "cookies_string": cookies_string
+                "cookies_string": cookies_string,
+                "username": username or gradescope.config["username"],
             }
             last_cookies = data
             return data
 
 
-def request(endpoint=None, url=None, data=None, json=None, **kwargs):
-    # type: (_typing.Optional[str], _typing.Optional[str], _typing.Optional[_typing.Union[str, dict]], _typing.Optional[dict], dict) -> _requests.Response
+def load_session(username=None):
+    # type: (_typing.Optional[str]) -> _typing.Optional[dict]
+    """
+    Reuse the login saved by an earlier run, if it has not expired.
+    """
+    global last_cookies
+
+    username = username or gradescope.config["username"]
+    saved = gradescope.session_file.load(username)
+    if saved is None:
+        return
+
+    session = get_session()
+    gradescope.session_file.restore_cookies(session.cookies, saved["cookies"])
+
+    last_cookies = {
+        "authenticity_token": saved["authenticity_token"],
+        "_gradescope_session": session.cookies.get("_gradescope_session"),
+        "signed_token": session.cookies.get("signed_token"),
+        "cookies": session.cookies,
+        "username": username,
+        "saved_cookies": saved["cookies"],
+    }
+    return last_cookies
+
+
+def save_session():
+    # type: () -> None
+    """
+    Save the cookies of the current login for later runs and other workers.
+    """
+    records = gradescope.session_file.cookie_records(get_session().cookies)
+    gradescope.session_file.save(last_cookies["username"], last_cookies, records)
+    last_cookies["saved_cookies"] = records
+
+
+def login(**kwargs):
+    # type: (dict) -> _typing.Optional[dict]
+    """
+    Make sure we are logged in, reusing a saved login when there is one.
+    """
+    # Only one thread (and one process) logs in; the others wait and reuse
+    # its cookies
+    with _login_lock, gradescope.metrics.phase("login"):
+        if last_cookies is None:
+            with gradescope.session_file.login_lock():
+                if load_session(kwargs.get("username")) is None:
+                    if get_auth_cookies(**kwargs) is not None:
+                        save_session()
+
+    return last_cookies
+
+
+def invalidate_login(stale):
+    # type: (_typing.Optional[dict]) -> None
+    """
+    Forget a login the server no longer accepts, unless another thread has
+    already replaced it.
+    """
+    global last_cookies
+
+    with _login_lock:
+        if last_cookies is not stale:
+            return
+
+        last_cookies = None
+        get_session().cookies.clear()
+        gradescope.session_file.clear(
+            cookies=stale.get("saved_cookies") if stale else None)
+
+
+def login_required(res):
+    # type: (_requests.Response) -> bool
+    path = _six.moves.urllib.parse.urlparse(str(res.url)).path
+    return res.status_code == 401 or path.rstrip("/") == "/login"
+
+
+def iter_body(res, chunk_size=STREAM_CHUNK_SIZE):
+    # type: (_requests.Response, int) -> _typing.Iterator[bytes]
+    """Iterate over the body of a streamed response, counting its bytes."""
+    for chunk in res.iter_content(chunk_size):
+        gradescope.metrics.count("bytes_received", len(chunk), source="network")
+        yield chunk
+
+
+def _count_response(res, stream=False):
+    # type: (_requests.Response, bool) -> None
+    source = "network"
+    if getattr(res, "from_cache", False):
+        source = "cache"
+    elif getattr(res, "from_cassette", False):
+        source = "cassette"
+
+    gradescope.metrics.count(
+        "requests", method=res.request.method if res.request else "GET",
+        status=res.status_code)
+    # a streamed body is counted by whoever reads it
+    if not stream:
+        gradescope.metrics.count("bytes_received", len(res.content), source=source)
+
+
+def request(endpoint=None, url=None, data=None, json=None, relogin=True, stream=False,
+            headers=None, **kwargs):
+    # type: (_typing.Optional[str], _typing.Optional[str], _typing.Optional[_typing.Union[str, dict]], _typing.Optional[dict], bool, bool, _typing.Optional[dict], dict) -> _requests.Response
     """
     Make a request directly to the Ed platform's API.
+
+    If the server sends us back to the login page, log in again and retry
+    once (unless `relogin` is False). While a cassette is replaying (see
+    `enable_cassette`) responses come from the cassette, without logging in.
+
+    Every request goes through the shared rate limiter, which also retries
+    throttled (429) and failed idempotent requests; see `configure_rate_limit`.
+
+    With `stream`, a GET bypasses the response cache and its body is not read
+    up front: iterate over `iter_content` and close the response when done.
+    Extra `headers` (such as a Range) are sent as given; a GET with headers
+    also bypasses the cache.
     """
 
-    if last_cookies is None:
-        get_auth_cookies(**kwargs)
+    replaying = _cassette is not None and _cassette.replaying
+
+    if last_cookies is None and not replaying:
+        login(**kwargs)
+
+    current_login = last_cookies
 
     # If only endpoint was passed, augment with base URL
     if endpoint is not None:
@@ -112,46 +446,46 @@ def request(endpoint=None, url=None, data=None, json=None, **kwargs):
             url=endpoint,
         )
 
-    headers = {
-        "Connection": "keep-alive",
-        "Pragma": "no-cache",
-        "Cache-Control": "no-cache",
-        "Upgrade-Insecure-Requests": "1",
-        "User-Agent": ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) "
-                       "AppleWebKit/537.36 (KHTML, like Gecko) "
-                       "Chrome/77.0.3865.120 Safari/537.36"),
-        "Sec-Fetch-Mode": "navigate",
-        "Sec-Fetch-User": "?1",
-        "Accept": "text/html,application/xhtml+xml,application/xml",
-        "Sec-Fetch-Site": "same-origin",
-        "Referer": BASE_URL,
-        "Cookie": last_cookies.get("cookies_string"),
-    }
+    # Default headers and the login cookies live on the shared session
+    session = get_session()
 
     try:
 
-        if data is None and json is None:
-            res = _requests.get(
-                url=url,
-                headers=headers,
-            )
-
-        elif json is not None:
-            res = _requests.post(
-                url=url,
-                headers=headers,
-                json=json,
-            )
-
-        else:
-            res = _requests.post(
-                url=url,
-                headers=headers,
-                data=data,
-            )
+        with gradescope.metrics.phase("http"):
+            if data is None and json is None and (stream or headers):
+                res = session.get(url=url, headers=headers, stream=stream)
+
+            elif data is None and json is None:
+                res = _cached_get(session, url)
+
+            elif json is not None:
+                res = session.post(
+                    url=url,
+                    json=json,
+                    headers=headers,
+                )
+
+            else:
+                res = session.post(
+                    url=url,
+                    data=data,
+                    headers=headers,
+                )
+
+        _count_response(res, stream)
+
+        if relogin and not replaying and login_required(res):
+            res.close()
+            invalidate_login(current_login)
+            gradescope.metrics.count("retries", reason="relogin")
+            return request(
+                url=url, data=data, json=json, relogin=False, stream=stream,
+                headers=headers, **kwargs)
 
         if res.status_code == 301 and url[-1] != "/":
-            return request(url="{}/".format(url))
+            res.close()
+            gradescope.metrics.count("retries", reason="trailing_slash")
+            return request(url="{}/".format(url), stream=stream, headers=headers)
 
     except _requests.RequestException as exc:
         raise
@@ -0,0 +1,201 @@
+"""
+Optional on-disk cache for `gradescope.api.request` responses.
+
+Bodies are stored on disk keyed by URL plus the identity of the logged-in
+user. A fresh entry (younger than the TTL of its endpoint) is served without
+touching the network; a stale one is revalidated with `If-None-Match` /
+`If-Modified-Since` when the server gave us an `ETag` / `Last-Modified`.
+The cache is kept under `max_bytes` by evicting least recently used entries.
+"""
+
+import hashlib as _hashlib
+import io as _io
+import json as _json
+import os as _os
+import re as _re
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import typing as _typing
+
+import requests as _requests
+import requests.structures as _structures
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# (url pattern, seconds an entry is served without revalidation); a URL that
+# matches none of the patterns is never cached
+DEFAULT_TTLS = [
+    (r"/account$", HOUR),
+    (r"/courses/[0-9]+/assignments/?$", HOUR),
+    (r"/courses/[0-9]+/assignments/[0-9]+/edit$", DAY),
+    (r"/courses/[0-9]+/assignments/[0-9]+/outline/edit$", DAY),
+    (r"/files/", 30 * DAY),
+]
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class ResponseCache(object):
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+        # type: (str, int, _typing.Optional[_typing.List[_typing.Tuple[str, float]]]) -> None
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = [
+            (_re.compile(pattern), ttl)
+            for pattern, ttl in (DEFAULT_TTLS if ttls is None else ttls)
+        ]
+
+        _os.makedirs(directory, exist_ok=True)
+
+        self._lock = _threading.Lock()
+        self._index = self._load_index()
+
+    # -- keys and files --------------------------------------------------------
+
+    def ttl(self, url):
+        # type: (str) -> _typing.Optional[float]
+        for pattern, ttl in self.ttls:
+            if pattern.search(url.split("?")[0]):
+                return ttl
+        return None
+
+    @staticmethod
+    def key(url, identity):
+        # type: (str, _typing.Optional[str]) -> str
+        return _hashlib.sha256(
+            "{}\n{}".format(identity or "", url).encode()).hexdigest()
+
+    def _body_path(self, key):
+        return _os.path.join(self.directory, key + ".body")
+
+    def _meta_path(self, key):
+        return _os.path.join(self.directory, key + ".json")
+
+    def _load_index(self):
+        # key -> [size in bytes, last used]
+        index = {}
+        for name in _os.listdir(self.directory):
+            if not name.endswith(".body"):
+                continue
+            path = _os.path.join(self.directory, name)
+            stat = _os.stat(path)
+            index[name[:-len(".body")]] = [stat.st_size, stat.st_atime]
+        return index
+
+    def _write_atomic(self, path, content):
+        fd, tmp_path = _tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with _os.fdopen(fd, "wb") as f:
+            f.write(content)
+        _os.replace(tmp_path, path)
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        for path in (self._body_path(key), self._meta_path(key)):
+            try:
+                _os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes:
+            return
+
+        for key, (size, _) in sorted(self._index.items(), key=lambda x: x[1][1]):
+            self._remove(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # -- lookups ---------------------------------------------------------------
+
+    def get(self, key):
+        # type: (str) -> _typing.Optional[_typing.Tuple[dict, bytes]]
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = _json.load(f)
+            with open(self._body_path(key), "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = _time.time()
+
+        return meta, body
+
+    def put(self, key, response):
+        # type: (str, _requests.Response) -> None
+        meta = {
+            "url": response.url,
+            "stored_at": _time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+        }
+
+        with self._lock:
+            self._write_atomic(self._body_path(key), response.content)
+            self._write_atomic(self._meta_path(key), _json.dumps(meta).encode())
+            self._index[key] = [len(response.content), meta["stored_at"]]
+            self._evict()
+
+    def touch(self, key, meta):
+        # type: (str, dict) -> None
+        """Mark a revalidated entry as fresh again."""
+        meta["stored_at"] = _time.time()
+        with self._lock:
+            self._write_atomic(self._meta_path(key), _json.dumps(meta).encode())
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+
+    # -- request integration ---------------------------------------------------
+
+    @staticmethod
+    def is_fresh(meta, ttl):
+        # type: (dict, float) -> bool
+        return _time.time() - meta["stored_at"] < ttl
+
+    @staticmethod
+    def conditional_headers(meta):
+        # type: (dict) -> dict
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    @staticmethod
+    def to_response(meta, body):
+        # type: (dict, bytes) -> _requests.Response
+        """Rebuild a `requests.Response` from a cache entry."""
+        response = _requests.Response()
+        response.status_code = 200
+        response.url = meta["url"]
+        response._content = body
+        # the body is already in memory: iter_content, iter_body and close
+        # work as on a response whose body has been read
+        response._content_consumed = True
+        response.raw = _io.BytesIO()
+        response.raw.close()
+        response.headers = _structures.CaseInsensitiveDict()
+        if meta.get("content_type"):
+            response.headers["Content-Type"] = meta["content_type"]
+        if meta.get("etag"):
+            response.headers["ETag"] = meta["etag"]
+        if meta.get("last_modified"):
+            response.headers["Last-Modified"] = meta["last_modified"]
+        response.encoding = _requests.utils.get_encoding_from_headers(
+            response.headers)
+        response.from_cache = True
+        return response
@@ -0,0 +1,194 @@
+"""
+Record Gradescope traffic to a cassette and replay it without a network.
+
+A cassette is a single zip archive. Every response body is stored once, as a
+deflated member named by its sha256, and `index.json` maps each request
+(method, URL and a hash of the request body) to its status, headers and body.
+Cookies are never written: `Cookie`/`Set-Cookie` headers are stripped, and
+the login handshake itself is not recorded. Conditional (`304`) responses are
+not recorded either, so record without the response cache.
+
+The cassette is mounted as the transport adapter of the shared session (see
+`gradescope.api.enable_cassette`), so page requests, images and streamed pdf
+downloads are all recorded or replayed. Replaying a request that is not in
+the cassette raises `CassetteMiss`.
+"""
+
+import hashlib as _hashlib
+import io as _io
+import json as _json
+import threading as _threading
+import typing as _typing
+import zipfile as _zipfile
+
+import requests as _requests
+import requests.adapters as _adapters
+import requests.structures as _structures
+import six as _six
+
+RECORD = "record"
+REPLAY = "replay"
+MODES = (RECORD, REPLAY)
+
+INDEX_MEMBER = "index.json"
+
+# Never written to a cassette
+STRIPPED_HEADERS = {"cookie", "set-cookie", "authorization"}
+
+# Bodies are stored decoded, so these no longer describe them
+ENCODING_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+# The login handshake carries credentials and fresh cookies
+LOGIN_PATHS = {"", "/", "/login"}
+
+
+class CassetteMiss(_requests.RequestException):
+    pass
+
+
+def request_key(method, url, body):
+    # type: (str, str, _typing.Optional[_typing.Union[str, bytes]]) -> str
+    key = "{} {}".format(method, url)
+    if body:
+        if isinstance(body, str):
+            body = body.encode()
+        key += " " + _hashlib.sha256(body).hexdigest()[:16]
+    return key
+
+
+def is_login(url):
+    # type: (str) -> bool
+    return _six.moves.urllib.parse.urlparse(url).path in LOGIN_PATHS
+
+
+class Cassette(object):
+
+    def __init__(self, filename, mode):
+        # type: (str, str) -> None
+        if mode not in MODES:
+            raise ValueError("Unknown cassette mode {!r}, expected one of {}".format(
+                mode, ", ".join(MODES)))
+
+        self.filename = filename
+        self.mode = mode
+        self._lock = _threading.Lock()
+
+        if mode == RECORD:
+            self._archive = _zipfile.ZipFile(
+                filename, "w", compression=_zipfile.ZIP_DEFLATED)
+            self._index = {}
+            self._bodies = set()
+        else:
+            self._archive = _zipfile.ZipFile(filename, "r")
+            self._index = _json.loads(self._archive.read(INDEX_MEMBER))
+
+    @property
+    def replaying(self):
+        # type: () -> bool
+        return self.mode == REPLAY
+
+    def adapter(self, **pool_kwargs):
+        # type: (dict) -> _adapters.BaseAdapter
+        """The transport adapter to mount on a session."""
+        if self.replaying:
+            return ReplayAdapter(self)
+        return RecordingAdapter(self, **pool_kwargs)
+
+    def __len__(self):
+        return len(self._index)
+
+    def urls(self, method="GET", status=200):
+        # type: (str, int) -> _typing.List[str]
+        """The URLs of the recorded requests with this method and status."""
+        return sorted(
+            key.split(" ")[1] for key, entry in self._index.items()
+            if key.startswith(method + " ") and entry["status"] == status
+        )
+
+    def record(self, request, response):
+        # type: (_requests.PreparedRequest, _requests.Response) -> None
+        if response.status_code == 304 or is_login(request.url):
+            return
+
+        body = response.content
+        digest = _hashlib.sha256(body).hexdigest()
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in STRIPPED_HEADERS | ENCODING_HEADERS
+        }
+
+        with self._lock:
+            if digest not in self._bodies:
+                self._archive.writestr(digest, body)
+                self._bodies.add(digest)
+
+            self._index[request_key(request.method, request.url, request.body)] = {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": headers,
+                "body": digest,
+            }
+
+    def play(self, request):
+        # type: (_requests.PreparedRequest) -> _requests.Response
+        key = request_key(request.method, request.url, request.body)
+        entry = self._index.get(key)
+        if entry is None:
+            raise CassetteMiss("Not in cassette {}: {}".format(self.filename, key))
+
+        with self._lock:
+            body = self._archive.read(entry["body"])
+
+        response = _requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = _structures.CaseInsensitiveDict(entry["headers"])
+        response.headers["Content-Length"] = str(len(body))
+        response.encoding = _requests.utils.get_encoding_from_headers(
+            response.headers)
+        response.raw = _io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        response.from_cassette = True
+        return response
+
+    def close(self):
+        # type: () -> None
+        with self._lock:
+            if self._archive is None:
+                return
+            if self.mode == RECORD:
+                self._archive.writestr(
+                    INDEX_MEMBER, _json.dumps(self._index, sort_keys=True))
+            self._archive.close()
+            self._archive = None
+
+
+class RecordingAdapter(_adapters.HTTPAdapter):
+
+    def __init__(self, cassette, **kwargs):
+        # type: (Cassette, dict) -> None
+        self.cassette = cassette
+        super(RecordingAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        # reads a streamed body now; iter_content then serves it from memory
+        self.cassette.record(request, response)
+        return response
+
+
+class ReplayAdapter(_adapters.BaseAdapter):
+
+    def __init__(self, cassette):
+        # type: (Cassette) -> None
+        self.cassette = cassette
+        super(ReplayAdapter, self).__init__()
+
+    def send(self, request, **kwargs):
+        response = self.cassette.play(request)
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
@@ -32,8 +32,8 @@ class EdAPIException(Exception):
 def handle_api_error(res):
     # type: (_requests.Response) -> _typing.Optional[_typing.Dict]
 
-    # Exit on malformed argument or successful status code
-    if res is None or res.status_code == 200:
+    # Exit on malformed argument or successful status code (206 answers a Range)
+    if res is None or 200 <= res.status_code < 300:
         return
 
     # Assume there is an error and build information dictionary
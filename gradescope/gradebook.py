@@ -0,0 +1,169 @@
+"""
+A compact, columnar course gradebook.
+
+Students are rows, kept once in `students` (email or SID) with their row
+number in `index`, and every assignment is one column: an `array` of floats
+with NaN where the student has no graded submission. A course with hundreds
+of assignments and thousands of students is a few megabytes, instead of a
+dict per student per assignment.
+
+`write_csv` and `write_json` export it one row (or one column) at a time.
+"""
+
+import array as _array
+import csv as _csv
+import io as _io
+import json as _json
+import math as _math
+import typing as _typing
+
+from gradescope.raw_util import robust_float
+
+NAN = float("nan")
+
+
+def read_scores(content, use_email=True, only_graded=True):
+    # type: (bytes, bool, bool) -> _typing.Tuple[_typing.List[str], _array.array]
+    """
+    Read the student keys and total scores out of a scores.csv, without
+    building a dict per row. Ungraded submissions are NaN if only_graded.
+    """
+    reader = _csv.reader(
+        _io.StringIO(content.decode()),
+        quotechar='"',
+        delimiter=",",
+        quoting=_csv.QUOTE_ALL,
+        skipinitialspace=True,
+    )
+    header = next(reader, None)
+    if header is None:
+        return [], _array.array("d")
+
+    def column(name):
+        try:
+            return header.index(name)
+        except ValueError:
+            raise ValueError(
+                "scores.csv has no {!r} column (columns: {})".format(name, ", ".join(header))
+            )
+
+    key_column = column("Email" if use_email else "SID")
+    score_column = column("Total Score")
+    status_column = column("Status")
+
+    students = []
+    scores = _array.array("d")
+    for row in reader:
+        if not row:
+            continue
+        students.append(row[key_column])
+        if only_graded and row[status_column] != "Graded":
+            scores.append(NAN)
+        else:
+            scores.append(robust_float(row[score_column]))
+
+    return students, scores
+
+
+class Gradebook(object):
+
+    def __init__(self):
+        # student -> row number
+        self.index = {}  # type: _typing.Dict[str, int]
+        self.students = []  # type: _typing.List[str]
+        # (assignment id, assignment name), in column order
+        self.assignments = []  # type: _typing.List[_typing.Tuple[str, str]]
+        self.columns = []  # type: _typing.List[_array.array]
+
+    def add_column(self, assignment_id, name, students, scores):
+        # type: (str, str, _typing.Iterable[str], _typing.Iterable[float]) -> None
+        """Add an assignment, scored per student (students not listed get NaN)."""
+        column = _array.array("d", [NAN]) * len(self.students)
+
+        for student, score in zip(students, scores):
+            row = self.index.get(student)
+            if row is None:
+                row = self.index[student] = len(self.students)
+                self.students.append(student)
+                column.append(NAN)
+            column[row] = score
+
+        self.assignments.append((assignment_id, name))
+        self.columns.append(column)
+
+    def _pad(self):
+        # students first seen in a later column are NaN in the earlier ones
+        for column in self.columns:
+            if len(column) < len(self.students):
+                column.extend([NAN] * (len(self.students) - len(column)))
+
+    def column(self, name):
+        # type: (str) -> _array.array
+        """The scores for the assignment with this name (or id)."""
+        self._pad()
+        for i, (assignment_id, assignment_name) in enumerate(self.assignments):
+            if name in (assignment_name, assignment_id):
+                return self.columns[i]
+        raise KeyError(name)
+
+    def row(self, student):
+        # type: (str) -> _typing.List[float]
+        self._pad()
+        i = self.index[student]
+        return [column[i] for column in self.columns]
+
+    def rows(self):
+        # type: () -> _typing.Iterator[_typing.Tuple[str, _typing.List[float]]]
+        self._pad()
+        for i, student in enumerate(self.students):
+            yield student, [column[i] for column in self.columns]
+
+    def to_dict(self):
+        # type: () -> _typing.Dict[str, _typing.Dict[str, float]]
+        """The old nested {student: {assignment name: score}}, graded scores only."""
+        names = [name for _, name in self.assignments]
+        grades = {}
+        for student, scores in self.rows():
+            graded = {
+                name: score for name, score in zip(names, scores)
+                if not _math.isnan(score)
+            }
+            if graded:
+                grades[student] = graded
+        return grades
+
+    def write_csv(self, filename):
+        # type: (str) -> None
+        """One row per student, one column per assignment; NaN is empty."""
+        with open(filename, "w", newline="") as f:
+            writer = _csv.writer(f)
+            writer.writerow(["student"] + [name for _, name in self.assignments])
+            for student, scores in self.rows():
+                writer.writerow(
+                    [student] + ["" if _math.isnan(s) else s for s in scores])
+
+    def write_json(self, filename):
+        # type: (str) -> None
+        """Columnar JSON: the students, then each assignment's scores (NaN is null)."""
+        self._pad()
+        with open(filename, "w") as f:
+            f.write('{"students": ')
+            _json.dump(self.students, f)
+            f.write(', "assignments": [')
+            for i, ((assignment_id, name), column) in enumerate(
+                    zip(self.assignments, self.columns)):
+                if i:
+                    f.write(", ")
+                _json.dump({
+                    "id": assignment_id,
+                    "name": name,
+                    "scores": [None if _math.isnan(s) else s for s in column],
+                }, f)
+            f.write("]}\n")
+
+    def __len__(self):
+        return len(self.students)
+
+    def __repr__(self):
+        return "<Gradebook of {} students, {} assignments>".format(
+            len(self.students), len(self.assignments))
@@ -1,15 +1,22 @@
 import collections as _collections
-import csv as _csv
+import concurrent.futures as _futures
+import io as _io
 import json
-import os as _os
-import tempfile as _tempfile
+import time as _time
+import typing as _typing
+import zipfile as _zipfile
 
-import bs4 as _bs4
+import requests as _requests
+import six as _six
 
 import gradescope.api
+import gradescope.exceptions
+import gradescope.gradebook
+import gradescope.metrics
+import gradescope.parsing
+import gradescope.records
 import gradescope.raw_util
 import gradescope.util
-from gradescope.raw_util import robust_float
 
 ASSIGNMENT_URL_PATTERN = r"/courses/([0-9]*)/assignments/([0-9]*)$"
 
@@ -26,12 +33,17 @@ class GradescopeRole(gradescope.raw_util.DocEnum):
     READER = 3, "Reader user"
 
 
-def get_assignment_grades(course_id, assignment_id, simplified=False, **kwargs):
+def get_assignment_grades(course_id, assignment_id, simplified=False, compact=False, **kwargs):
     # Fetch the grades
     response = gradescope.api.request(
         endpoint="courses/{}/assignments/{}/scores.csv".format(course_id, assignment_id)
     )
 
+    # Compact records sharing one column index; see gradescope.records
+    if compact:
+        return list(gradescope.records.read_grade_records(
+            gradescope.util.iter_lines([response.content])))
+
     # Parse the CSV format
     grades = gradescope.util.parse_csv(response.content)
 
@@ -47,53 +59,70 @@ def get_assignment_grades(course_id, assignment_id, simplified=False, **kwargs):
     return grades
 
 
-def get_assignment_evaluations(course_id, assignment_id, **kwargs):
+def iter_assignment_grades(course_id, assignment_id, simplified=False, compact=False, **kwargs):
+    """
+    Like get_assignment_grades, but parse the CSV as it streams in and yield
+    one record at a time, so memory stays flat however large the course.
+    """
     response = gradescope.api.request(
-        endpoint="courses/{}/assignments/{}/export_evaluations".format(
-            course_id, assignment_id
-        )
+        endpoint="courses/{}/assignments/{}/scores.csv".format(course_id, assignment_id),
+        stream=True,
+    )
+
+    with response:
+        if compact:
+            yield from gradescope.records.read_grade_records(
+                gradescope.util.iter_lines(gradescope.api.iter_body(response)))
+            return
+
+        for record in gradescope.util.iter_csv(gradescope.api.iter_body(response)):
+            if simplified:
+                yield gradescope.util.shortened_grade_record(record)
+                continue
+
+            grade = gradescope.util.collapse_grade(record)
+            gradescope.util.to_numeric([grade], ("Total Score", "Max Points", "View Count"))
+            yield grade
+
+
+def get_assignment_evaluations(course_id, assignment_id, **kwargs):
+    endpoint = "courses/{}/assignments/{}/export_evaluations".format(
+        course_id, assignment_id
     )
 
-    # Fetch assignment grades for scaffolding
-    grades = get_assignment_grades(course_id, assignment_id)
+    # Fetch the export while fetching the assignment grades for scaffolding
+    with _futures.ThreadPoolExecutor(max_workers=1) as pool:
+        export = pool.submit(gradescope.api.request, endpoint=endpoint)
+        grades = get_assignment_grades(course_id, assignment_id)
+        response = export.result()
 
     if len(grades) == 0:
         return []
 
     subid_grades = {person["Submission ID"]: person for person in grades}
 
-    # Open temp directory for extraction
-    with _tempfile.TemporaryDirectory() as td:
-        file_path = gradescope.util.extract_evaluations(td, response.content)
+    # Read the sheets straight out of the zip, without extracting it. Parsing
+    # is pure Python and holds the GIL, so the sheets are read one by one.
+    with _zipfile.ZipFile(_io.BytesIO(response.content)) as zf:
+        sheets = gradescope.util.evaluation_sheets(zf)
 
         # Find question name for each sheet
-        sheets = [i for i in _os.listdir(file_path) if ".csv" in i]
-        sheet_map = gradescope.util.map_sheets(sheets, grades[0]["questions"].keys())
+        sheet_map = gradescope.util.map_sheets(list(sheets), grades[0]["questions"].keys())
 
-        # Read questions from each sheet
-        for sheet in sheets:
+        for sheet, name in sheets.items():
             q_name = sheet_map[sheet]
-            with open(_os.path.join(file_path, sheet)) as csvfile:
-                reader = _csv.DictReader(
-                    csvfile,
-                    quotechar='"',
-                    delimiter=",",
-                    quoting=_csv.QUOTE_ALL,
-                    skipinitialspace=True,
-                )
-                # Match rows to students
-                for row in reader:
-                    if row["Assignment Submission ID"] not in subid_grades:
-                        continue
-
-                    subid = row["Assignment Submission ID"]
 
-                    new_row = gradescope.util.read_eval_row(row)
+            # Match rows to students
+            for row in gradescope.util.read_evaluation_sheet(zf, name):
+                subid = row["Assignment Submission ID"]
+                if subid not in subid_grades:
+                    continue
 
-                    if new_row["score"] != subid_grades[subid]["questions"][q_name]:
-                        raise ValueError("Mismatched scores!")
+                new_row = gradescope.util.read_eval_row(row)
+                if new_row["score"] != subid_grades[subid]["questions"][q_name]:
+                    raise ValueError("Mismatched scores!")
 
-                    subid_grades[subid]["questions"][q_name] = new_row
+                subid_grades[subid]["questions"][q_name] = new_row
 
     return list(subid_grades.values())
 
@@ -110,30 +139,170 @@ def get_course_roster(course_id, **kwargs):
     return roster
 
 
-def invite_many(course_id, role, users, **kwargs):
-    # type: (int, GradescopeRole, _typing.List[_typing.Tuple[str, str]], dict) -> bool
+def iter_course_roster(course_id, **kwargs):
+    """Like get_course_roster, one member at a time as the CSV streams in."""
+    response = gradescope.api.request(
+        endpoint="courses/{}/memberships.csv".format(course_id),
+        stream=True,
+    )
+
+    with response:
+        for record in gradescope.util.iter_csv(gradescope.api.iter_body(response)):
+            yield record
+
+
+# Users per memberships/many request, and how many requests are in flight
+INVITE_CHUNK_SIZE = 100
+INVITE_JOBS = 4
+
+# Seconds before the first retry of failed chunks, doubled for each later one
+INVITE_RETRY_DELAY = 1.0
+
+
+class InviteChunk(object):
+    """One memberships/many request: a slice of the users and how it went"""
+
+    def __init__(self, index, users):
+        # type: (int, _typing.List[_typing.Tuple[str, str]]) -> None
+        self.index = index
+        self.users = users
+        self.status_code = None  # type: _typing.Optional[int]
+        self.error = None  # type: _typing.Optional[str]
+        self.attempts = 0
+
+    @property
+    def ok(self):
+        # type: () -> bool
+        return self.error is None and self.status_code == 200
+
+    def __repr__(self):
+        return "<InviteChunk {} of {} users: {}>".format(
+            self.index, len(self.users), "ok" if self.ok else self.error or self.status_code)
+
+
+class InviteResult(object):
+    """
+    The outcome of `invite_many`, chunk by chunk. It is truthy when every
+    chunk went through; otherwise `failed_users` can be passed to
+    `invite_many` again to resume with only the users that were not added.
+    """
+
+    def __init__(self, chunks):
+        # type: (_typing.List[InviteChunk]) -> None
+        self.chunks = chunks
+
+    @property
+    def ok(self):
+        # type: () -> bool
+        return all(chunk.ok for chunk in self.chunks)
+
+    @property
+    def failed(self):
+        # type: () -> _typing.List[InviteChunk]
+        return [chunk for chunk in self.chunks if not chunk.ok]
+
+    @property
+    def invited_users(self):
+        # type: () -> _typing.List[_typing.Tuple[str, str]]
+        return [user for chunk in self.chunks if chunk.ok for user in chunk.users]
+
+    @property
+    def failed_users(self):
+        # type: () -> _typing.List[_typing.Tuple[str, str]]
+        return [user for chunk in self.failed for user in chunk.users]
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return "<InviteResult {} of {} chunks ok>".format(
+            len(self.chunks) - len(self.failed), len(self.chunks))
+
+
+def _invite_chunk(course_id, role, chunk):
+    # type: (int, GradescopeRole, InviteChunk) -> InviteChunk
 
     # Built payload
     payload = _collections.OrderedDict()
     counter = 0
-    for email, name in users:
+    for email, name in chunk.users:
         payload["students[{}][name]".format(counter)] = name
         payload["students[{}][email]".format(counter)] = email
         counter += 1
     payload["role"] = role
 
-    # Fetch the grades
-    response = gradescope.api.request(
-        endpoint="courses/{}/memberships/many".format(course_id),
-        data=payload,
-    )
+    chunk.attempts += 1
+    try:
+        response = gradescope.api.request(
+            endpoint="courses/{}/memberships/many".format(course_id),
+            data=payload,
+        )
+        chunk.status_code = response.status_code
+        chunk.error = None
+    except gradescope.exceptions.EdAPIException as exc:
+        chunk.status_code = exc.data.get("http_code")
+        chunk.error = repr(exc)
+    except _requests.RequestException as exc:
+        chunk.error = repr(exc)
+
+    return chunk
+
+
+def invite_many(course_id, role, users, chunk_size=INVITE_CHUNK_SIZE, jobs=INVITE_JOBS,
+                retries=2, **kwargs):
+    # type: (int, GradescopeRole, _typing.List[_typing.Tuple[str, str]], int, int, int, dict) -> InviteResult
+    """
+    Invite (email, name) users to the course, `chunk_size` users per request
+    with up to `jobs` requests at once. Chunks that fail are retried, on
+    their own, up to `retries` more times with exponential backoff.
+    """
+    users = list(users)
+    chunks = [
+        InviteChunk(index, users[start:start + chunk_size])
+        for index, start in enumerate(range(0, len(users), chunk_size))
+    ]
+
+    pending = chunks
+    with _futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        for attempt in range(retries + 1):
+            if attempt:
+                _time.sleep(INVITE_RETRY_DELAY * 2 ** (attempt - 1))
+
+            list(pool.map(lambda chunk: _invite_chunk(course_id, role, chunk), pending))
+
+            pending = [chunk for chunk in pending if not chunk.ok]
+            if not pending:
+                break
+
+    return InviteResult(chunks)
+
+
+def _parse_courses_lxml(content):
+    has_class = gradescope.parsing.has_class
+    tree = gradescope.parsing.html_tree(content)
+    courses = []
+    for box in tree.xpath("//a" + has_class("courseBox")):
+        href = box.get("href")
+        course_id = href.split("/")[-1]
+        course_code = box.xpath(".//h3" + has_class("courseBox--shortname"))[0].text_content()
+        course_name = box.xpath(".//div" + has_class("courseBox--name"))[0].text_content()
+        courses.append(
+            {
+                "name": course_name,
+                "id": course_id,
+                "code": course_code,
+            }
+        )
+    return courses
 
-    return response.status_code == 200
 
+@gradescope.metrics.timed("parse")
+def parse_courses(content):
+    if gradescope.parsing.use_lxml():
+        return _parse_courses_lxml(content)
 
-def get_courses():
-    response = gradescope.api.request(endpoint="account")
-    soup = _bs4.BeautifulSoup(response.content, features="html.parser")
+    soup = gradescope.parsing.make_soup(
+        content, parse_only=gradescope.parsing.strainer("a", class_="courseBox"))
     course_boxes = soup.find_all("a", {"class": "courseBox"})
     courses = []
     for box in course_boxes:
@@ -151,13 +320,52 @@ def get_courses():
     return courses
 
 
-# gets all assignments
-def get_assignments(course_ids):
-    assert len(course_ids) > 0
-    course_page_id = course_ids[0]
-    endpoint = f"courses/{course_page_id}/assignments"
-    result = gradescope.api.request(endpoint=endpoint)
-    soup = _bs4.BeautifulSoup(result.content.decode(), features="html.parser")
+def get_courses():
+    response = gradescope.api.request(endpoint="account")
+    return parse_courses(response.content)
+
+
+def _parse_assignments_lxml(content, course_ids):
+    has_class = gradescope.parsing.has_class
+    tree = gradescope.parsing.html_tree(content)
+
+    all_assignment_table = tree.xpath("//ul" + has_class("treeSelector"))[0]
+    course_rows = all_assignment_table.xpath(".//li" + has_class("js-courseRow"))
+    assignments = []
+    for course_row in course_rows:
+        course_id = course_row.xpath(".//button")[0].get("id").split("course-")[1]
+        if course_id not in course_ids:
+            continue
+        course_code = course_row.xpath(".//div" + has_class("type-heading"))[0].text_content()
+        assignment_rows = course_row.xpath(".//li" + has_class("js-assignmentRow"))
+
+        for row in assignment_rows:
+            buttons = row.xpath(".//button")
+            if not buttons:
+                continue
+
+            # Like the soup version, the last button of the row wins
+            button = buttons[-1]
+            assignment_id = button.get("data-assignment-id")
+            assignments.append(
+                {
+                    "id": assignment_id,
+                    "name": button.text_content(),
+                    "course_id": course_id,
+                    "course_code": course_code,
+                    "href": f"https://gradescope.com/courses/{course_id}/assignments/{assignment_id}",
+                }
+            )
+    return assignments
+
+
+@gradescope.metrics.timed("parse")
+def parse_assignments(content, course_ids):
+    if gradescope.parsing.use_lxml():
+        return _parse_assignments_lxml(content, course_ids)
+
+    soup = gradescope.parsing.make_soup(
+        content, parse_only=gradescope.parsing.strainer("ul", class_="treeSelector"))
 
     all_assignment_table = soup.select_one("ul.treeSelector")
     course_rows = all_assignment_table.findChildren("li", {"class": "js-courseRow"})
@@ -190,14 +398,60 @@ def get_assignments(course_ids):
     return assignments
 
 
+def assignments_endpoint(course_ids):
+    assert len(course_ids) > 0
+    course_page_id = course_ids[0]
+    return f"courses/{course_page_id}/assignments"
+
+
+# gets all assignments
+def get_assignments(course_ids):
+    result = gradescope.api.request(endpoint=assignments_endpoint(course_ids))
+    return parse_assignments(result.content, course_ids)
+
+
 def find(iterable, condition):
     return next((item for item in iterable if condition(item)), None)
 
 
-def get_assignment_submissions(course_id, assignment_id, **kwargs):
-    endpoint = f"courses/{course_id}/assignments/{assignment_id}/review_grades"
-    result = gradescope.api.request(endpoint=endpoint)
-    soup = _bs4.BeautifulSoup(result.content.decode(), features="html.parser")
+def _parse_assignment_submissions_lxml(content):
+    tree = gradescope.parsing.html_tree(content)
+
+    submissions_table = tree.xpath(
+        "//table" + gradescope.parsing.has_class("js-reviewGradesTable"))[0]
+
+    submissions = []
+    for row in submissions_table.xpath(".//tr"):
+        cells = row.xpath(".//td")
+
+        # Get the student name and submission ID
+        student_name = cells[0].text_content().strip()
+        anchors = cells[0].xpath(".//a")
+        href = anchors[0].get("href") if anchors else None
+        submission_id = href.split("/")[-1] if href else None
+
+        if not href or not submission_id:
+            continue
+
+        # Get the email
+        celltexts = [c.text_content().strip() for c in cells]
+        email = find(celltexts, lambda c: "@" in c)
+
+        submissions.append(
+            {"id": submission_id, "href": href, "name": student_name, "email": email}
+        )
+
+    return submissions
+
+
+@gradescope.metrics.timed("parse")
+def parse_assignment_submissions(content):
+    if gradescope.parsing.use_lxml():
+        return _parse_assignment_submissions_lxml(content)
+
+    soup = gradescope.parsing.make_soup(
+        content,
+        parse_only=gradescope.parsing.strainer("table", class_="js-reviewGradesTable"))
 
     submissions_table = soup.find("table", {"class": "js-reviewGradesTable"})
     submissions_rows = submissions_table.findChildren("tr")
@@ -226,72 +480,109 @@ def get_assignment_submissions(course_id, assignment_id, **kwargs):
     return submissions
 
 
+def get_assignment_submissions(course_id, assignment_id, **kwargs):
+    endpoint = f"courses/{course_id}/assignments/{assignment_id}/review_grades"
+    result = gradescope.api.request(endpoint=endpoint)
+    return parse_assignment_submissions(result.content)
+
+
+def submission_pdf_url(submission):
+    """The graded pdf of a submission listed by get_assignment_submissions"""
+    return _six.moves.urllib.parse.urljoin(
+        base=gradescope.api.BASE_URL,
+        url=submission["href"] + ".pdf",
+    )
+
+
 def get_image(path):
     result = gradescope.api.request(endpoint=path)
     return result
 
 
-def get_data_from_assignment(course_id, assignment_id):
-    outline_url = f"https://www.gradescope.com/courses/{course_id}/assignments/{assignment_id}/outline/edit"
-    result = gradescope.api.request(endpoint=outline_url)
-    soup = _bs4.BeautifulSoup(result.content.decode(), features="html.parser")
+@gradescope.metrics.timed("parse")
+def parse_assignment_data(content):
+    # Fast path: read the two attributes we need straight from the page
+    title = gradescope.parsing.find_tag_attribute(
+        content, "title", tag_pattern=rb'<h2\b[^>]*\bsidebar--title\b[^>]*>')
+    # only from the first div in #main-content, like the selector below
+    attr = gradescope.parsing.find_tag_attribute(
+        content, "data-react-props", after=b'id="main-content"',
+        tag_pattern=rb'<div\b[^>]*>')
+    if title is not None and attr is not None:
+        with gradescope.metrics.phase("json_decode"):
+            return {"title": title} | json.loads(attr)
+
+    soup = gradescope.parsing.make_soup(content)
 
     editor = soup.select_one("#main-content div")
     title = soup.select_one("h2.sidebar--title").get("title")
     attr = editor.get("data-react-props")
-    react_props = json.loads(attr)
+    with gradescope.metrics.phase("json_decode"):
+        react_props = json.loads(attr)
     data = {"title": title}
     return data | react_props
 
 
+def get_data_from_assignment(course_id, assignment_id):
+    outline_url = f"courses/{course_id}/assignments/{assignment_id}/outline/edit"
+    result = gradescope.api.request(endpoint=outline_url)
+    return parse_assignment_data(result.content)
+
+
+@gradescope.metrics.timed("parse")
+def parse_assignment_template_href(content):
+    soup = gradescope.parsing.make_soup(
+        content, parse_only=gradescope.parsing.strainer(class_="fileUpload"))
+
+    download_pdf_button = soup.select_one(".fileUpload a.tiiBtn")
+    if download_pdf_button:
+        pdf_href = download_pdf_button.get("href")
+        return pdf_href
+
+    # Returns None if there is no template to download
+
+
 def get_assignment_template_href(course_id, assignment_id):
     # go to https://www.gradescope.com/courses/{course_id}/assignments/{assignment_id}/edit
     # get the 'download pdf' link, pull the pdf from there, save it
     #    (this works for upload-style assignments)
     edit_page_url = f"courses/{course_id}/assignments/{assignment_id}/edit"
     result = gradescope.api.request(endpoint=edit_page_url)
-    soup = _bs4.BeautifulSoup(result.content.decode(), features="html.parser")
+    return parse_assignment_template_href(result.content)
 
-    download_pdf_button = soup.select_one(".fileUpload a.tiiBtn")
-    if download_pdf_button:
-        pdf_href = download_pdf_button.get("href")
-        return pdf_href
 
-    # Returns None if there is no template to download
+def get_course_assignments(course_id):
+    """The assignments of one course, as [{"id": ..., "name": ..., ...}]"""
+    course_id = str(course_id)
+    result = gradescope.api.request(endpoint=assignments_endpoint([course_id]))
+    return parse_assignments(result.content, [course_id])
 
 
-def get_course_grades(course_id, only_graded=True, use_email=True):
-    # Dictionary mapping student emails to grades
-    grades = {}
+def get_course_grades(course_id, only_graded=True, use_email=True, jobs=8):
+    # type: (int, bool, bool, int) -> gradescope.gradebook.Gradebook
+    """
+    The total score of every student on every assignment of the course, as a
+    columnar `Gradebook` (NaN where a student has no graded submission, or
+    none at all). Up to `jobs` scores.csv files are fetched at once.
+    """
+    gradebook = gradescope.gradebook.Gradebook()
 
     gradescope_assignments = get_course_assignments(course_id=course_id)
 
-    for assignment in gradescope_assignments:
-        # {'id': '273671', 'name': 'Written Exam 1'}
-        assignment_name = assignment["name"]
-        assignment_grades = get_assignment_grades(
-            course_id=course_id, assignment_id=assignment.get("id"), simplified=True
+    def fetch_scores(assignment):
+        # {'id': '273671', 'name': 'Written Exam 1', ...}
+        response = gradescope.api.request(
+            endpoint="courses/{}/assignments/{}/scores.csv".format(
+                course_id, assignment["id"])
         )
+        return gradescope.gradebook.read_scores(
+            response.content, use_email=use_email, only_graded=only_graded)
 
-        for record in assignment_grades:
-            # {'name': 'Joe Student',
-            #   'sid': 'jl27',
-            #   'email': 'jl27@princeton.edu',
-            #   'score': '17.75',
-            #   'graded': True,
-            #   'view_count': '4',
-            #   'id': '22534979'}
+    with _futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        # map keeps the columns in assignment order
+        all_scores = pool.map(fetch_scores, gradescope_assignments)
 
-            if only_graded and not record.get("graded", False):
-                continue
-
-            student_id = record["sid"]
-            if use_email:
-                student_id = record["email"]
-            grade = robust_float(record.get("score"))
+        for assignment, (students, scores) in zip(gradescope_assignments, all_scores):
+            gradebook.add_column(assignment["id"], assignment["name"], students, scores)
 
-            # Add grade to student
-            grades[student_id] = grades.get(student_id, dict())
-            grades[student_id][assignment_name] = grade
-
-    return grades
+    return gradebook
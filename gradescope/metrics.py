@@ -0,0 +1,196 @@
+"""
+Process-wide timing, byte and retry counters for an export run.
+
+Code marks the phases of a run with `phase("name")` (or the `timed("name")`
+decorator) and bumps counters with `count("name", value, **labels)`. Phases
+can nest, for example an image fetch includes its "http" time and parsing
+includes "json_decode", so phase times do not add up to the wall time. A
+phase entered again inside itself on the same thread (a timed function
+calling another one timed under the same name) is only counted once.
+
+`snapshot()` returns everything recorded so far as plain data, `merge` adds a
+snapshot taken in another process (a pdf renderer) to this one, and
+`write_json` / `write_prometheus` export the totals at the end of a run. The
+Prometheus file is in the text exposition format, written atomically so the
+node exporter's textfile collector can pick it up.
+"""
+
+import contextlib as _contextlib
+import functools as _functools
+import json as _json
+import os as _os
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import typing as _typing
+
+PREFIX = "gradescope_export"
+
+_lock = _threading.Lock()
+
+# phase -> [calls, total seconds, longest call in seconds]
+_phases = {}  # type: _typing.Dict[str, list]
+
+# (counter, sorted label items) -> value
+_counters = {}  # type: _typing.Dict[_typing.Tuple[str, tuple], float]
+
+_started = _time.time()
+
+# names of the phases open on this thread
+_active = _threading.local()
+
+
+def observe(name, seconds):
+    # type: (str, float) -> None
+    with _lock:
+        stats = _phases.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+
+@_contextlib.contextmanager
+def phase(name):
+    # type: (str) -> _typing.Iterator[None]
+    """Time the body of the with statement as one call of phase `name`.
+
+    Inside an open phase of the same name the body is not timed again."""
+    active = _active.__dict__.setdefault("names", set())
+    if name in active:
+        yield
+        return
+
+    active.add(name)
+    start = _time.perf_counter()
+    try:
+        yield
+    finally:
+        active.discard(name)
+        observe(name, _time.perf_counter() - start)
+
+
+def timed(name):
+    # type: (str) -> _typing.Callable
+    """Decorator timing every call of a function as phase `name`."""
+
+    def decorator(fn):
+        @_functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1, **labels):
+    # type: (str, float, str) -> None
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def reset():
+    # type: () -> None
+    global _started
+
+    with _lock:
+        _phases.clear()
+        _counters.clear()
+        _started = _time.time()
+
+
+def snapshot():
+    # type: () -> dict
+    with _lock:
+        return {
+            "started_at": _started,
+            "wall_seconds": _time.time() - _started,
+            "phases": {
+                name: {"calls": calls, "seconds": seconds, "max_seconds": longest}
+                for name, (calls, seconds, longest) in sorted(_phases.items())
+            },
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(_counters.items())
+            ],
+        }
+
+
+def merge(other):
+    # type: (dict) -> None
+    """Add the phases and counters of a snapshot from another process."""
+    with _lock:
+        for name, stats in other["phases"].items():
+            mine = _phases.setdefault(name, [0, 0.0, 0.0])
+            mine[0] += stats["calls"]
+            mine[1] += stats["seconds"]
+            mine[2] = max(mine[2], stats["max_seconds"])
+        for counter in other["counters"]:
+            key = (counter["name"], tuple(sorted(counter["labels"].items())))
+            _counters[key] = _counters.get(key, 0) + counter["value"]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    ) + "}"
+
+
+def prometheus_text(summary=None):
+    # type: (_typing.Optional[dict]) -> str
+    summary = summary or snapshot()
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append("# HELP {}_{} {}".format(PREFIX, name, description))
+        lines.append("# TYPE {}_{} {}".format(PREFIX, name, kind))
+        for labels, value in samples:
+            lines.append("{}_{}{} {}".format(PREFIX, name, _labels(labels), value))
+
+    phases = summary["phases"].items()
+    metric("phase_seconds_total", "counter", "Time spent in each phase of the run.",
+           [({"phase": name}, stats["seconds"]) for name, stats in phases])
+    metric("phase_calls_total", "counter", "Number of times each phase ran.",
+           [({"phase": name}, stats["calls"]) for name, stats in phases])
+    metric("phase_max_seconds", "gauge", "Longest single call of each phase.",
+           [({"phase": name}, stats["max_seconds"]) for name, stats in phases])
+
+    by_name = {}
+    for counter in summary["counters"]:
+        by_name.setdefault(counter["name"], []).append(
+            (counter["labels"], counter["value"]))
+    for name, samples in sorted(by_name.items()):
+        metric(name + "_total", "counter", "Total {}.".format(name.replace("_", " ")),
+               samples)
+
+    metric("wall_seconds", "gauge", "Wall time of the run so far.",
+           [({}, summary["wall_seconds"])])
+    metric("started_at_seconds", "gauge", "Unix time the run started.",
+           [({}, summary["started_at"])])
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(filename, text):
+    directory = _os.path.dirname(_os.path.abspath(filename))
+    _os.makedirs(directory, exist_ok=True)
+    fd, tmp_filename = _tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with _os.fdopen(fd, "w") as f:
+        f.write(text)
+    # mkstemp files are private; collectors usually run as another user
+    _os.chmod(tmp_filename, 0o644)
+    _os.replace(tmp_filename, filename)
+
+
+def write_json(filename, summary=None):
+    # type: (str, _typing.Optional[dict]) -> None
+    _write_atomic(filename, _json.dumps(summary or snapshot(), indent=2) + "\n")
+
+
+def write_prometheus(filename, summary=None):
+    # type: (str, _typing.Optional[dict]) -> None
+    _write_atomic(filename, prometheus_text(summary))
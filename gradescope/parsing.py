@@ -0,0 +1,109 @@
+"""
+HTML parsing backend shared by the scrapers in `gradescope.macros`.
+
+With the "lxml" backend (the default when lxml is installed) the large list
+pages are read straight from an lxml tree with XPath, and BeautifulSoup uses
+lxml as its tree builder everywhere else; "html.parser" is the pure-Python
+fallback. `set_parser` picks one explicitly. Scrapers pass a `SoupStrainer`
+so that only the part of the page they read is turned into a tree, and
+`find_tag_attribute` pulls a single attribute out of the raw bytes without
+building a tree at all.
+"""
+
+import html as _html
+import re as _re
+import typing as _typing
+
+import bs4 as _bs4
+
+try:
+    import lxml.html as _lxml_html
+    PARSER = "lxml"
+except ImportError:  # pragma: no cover
+    _lxml_html = None
+    PARSER = "html.parser"
+
+PARSERS = ("lxml", "html.parser")
+
+
+def set_parser(name):
+    # type: (str) -> None
+    """Select the BeautifulSoup tree builder, one of `PARSERS`."""
+    global PARSER
+
+    if name not in PARSERS:
+        raise ValueError("Unknown parser {!r}, expected one of {}".format(
+            name, ", ".join(PARSERS)))
+
+    if name == "lxml" and _lxml_html is None:
+        raise ValueError("The lxml parser is not installed")
+
+    PARSER = name
+
+
+def strainer(tag=None, **attrs):
+    # type: (_typing.Optional[str], dict) -> _bs4.SoupStrainer
+    """Only keep `tag` elements (any tag if None) with these attributes."""
+    if "class_" in attrs:
+        attrs["class"] = attrs.pop("class_")
+    return _bs4.SoupStrainer(tag, attrs=attrs)
+
+
+def _text(content):
+    # type: (_typing.Union[bytes, str]) -> str
+    # Gradescope serves utf-8, but not every page says so in a <meta charset>,
+    # and without one libxml2 would read the bytes as latin-1
+    if isinstance(content, bytes):
+        return content.decode()
+    return content
+
+
+def make_soup(content, parse_only=None):
+    # type: (_typing.Union[bytes, str], _typing.Optional[_bs4.SoupStrainer]) -> _bs4.BeautifulSoup
+    return _bs4.BeautifulSoup(_text(content), features=PARSER, parse_only=parse_only)
+
+
+def use_lxml():
+    # type: () -> bool
+    return PARSER == "lxml"
+
+
+def html_tree(content):
+    # type: (_typing.Union[bytes, str]) -> _typing.Any
+    """Parse a utf-8 page into an lxml tree (only with the lxml backend)."""
+    return _lxml_html.document_fromstring(_text(content))
+
+
+def has_class(name):
+    # type: (str) -> str
+    """XPath predicate for elements whose class list contains `name`."""
+    return "[contains(concat(' ', normalize-space(@class), ' '), ' {} ')]".format(name)
+
+
+def find_tag_attribute(content, attribute, after=None, tag_pattern=None):
+    # type: (bytes, str, _typing.Optional[bytes], _typing.Optional[bytes]) -> _typing.Optional[str]
+    """
+    Return the unescaped value of the first double-quoted `attribute` in the
+    raw page, without parsing it. The search starts after the first
+    occurrence of `after`, and is limited to tags matching `tag_pattern`.
+    Returns None when not found, so callers can fall back to a real parse.
+    """
+    start = 0
+    if after is not None:
+        start = content.find(after)
+        if start < 0:
+            return None
+
+    attribute_pattern = _re.compile(
+        rb"\s" + _re.escape(attribute.encode()) + rb'="([^"]*)"')
+
+    if tag_pattern is None:
+        match = attribute_pattern.search(content, start)
+    else:
+        tag = _re.compile(tag_pattern).search(content, start)
+        match = attribute_pattern.search(tag.group(0)) if tag else None
+
+    if match is None:
+        return None
+
+    return _html.unescape(match.group(1).decode())
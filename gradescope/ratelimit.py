@@ -0,0 +1,234 @@
+"""
+Adaptive rate limiting and retries for the shared session.
+
+Every request the session sends (pages, images, downloads) first takes a
+token from a token bucket, which caps the sustained request rate, and a slot
+under a concurrency limit that adapts AIMD-style: it grows by about one per
+window of successful responses, and halves when Gradescope answers 429 or
+503. Those answers also pause every sender until `Retry-After` has passed
+(at most `BACKOFF_MAX` seconds). A streamed response keeps its slot until it
+is closed or its body has been read. The limit never exceeds
+`max_concurrency`, 32 by default; `gradescope.api.configure_session` raises
+it to match a larger connection pool.
+
+Idempotent requests (GET, HEAD, OPTIONS) are retried on 429, 5xx gateway
+errors and connection errors, after `Retry-After` or an exponential backoff
+with full jitter. Other requests are only retried on 429, which means the
+server did not act on them.
+"""
+
+import email.utils as _email_utils
+import random as _random
+import threading as _threading
+import time as _time
+import typing as _typing
+import weakref as _weakref
+
+import requests as _requests
+import requests.adapters as _adapters
+
+import gradescope.metrics
+
+# Sustained requests per second (0 for no limit), and how many can go out
+# back to back
+DEFAULT_RATE = 50.0
+DEFAULT_BURST = 50
+
+# Bounds and starting point of the adaptive concurrency limit
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+INITIAL_CONCURRENCY = 8
+
+# Retries after the first attempt, and the backoff they use
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def retry_after(response):
+    # type: (_requests.Response) -> _typing.Optional[float]
+    """
+    Seconds to wait according to a Retry-After header, if there is one,
+    clamped to `BACKOFF_MAX` so one bad header cannot stall a sender.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = _email_utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = when.timestamp() - _time.time()
+
+    return min(BACKOFF_MAX, max(0.0, seconds))
+
+
+def backoff(attempt):
+    # type: (int) -> float
+    """Exponential backoff with full jitter for the `attempt`th retry (from 0)."""
+    return _random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY,
+                 initial_concurrency=INITIAL_CONCURRENCY):
+        # type: (float, int, int, int, int) -> None
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+
+        self._cond = _threading.Condition()
+        self._tokens = float(burst)
+        self._refilled_at = _time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+
+    def _refill(self, now):
+        if not self.rate:
+            self._tokens = float(self.burst)
+        else:
+            self._tokens = min(
+                float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self):
+        # type: () -> None
+        """Wait for a token and a free slot."""
+        with self._cond:
+            while True:
+                now = _time.monotonic()
+                self._refill(now)
+
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self._in_flight >= int(self.concurrency):
+                    timeout = None
+                elif self._tokens < 1:
+                    timeout = (1 - self._tokens) / self.rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+
+                self._cond.wait(timeout)
+
+    def release(self, status=None, wait=None):
+        # type: (_typing.Optional[int], _typing.Optional[float]) -> None
+        """
+        Give back a slot, adapting to the response `status` (None when the
+        request failed without one); `wait` is how long the server asked
+        everyone to hold off.
+        """
+        with self._cond:
+            # only grow a limit that the senders are actually reaching
+            saturated = self._in_flight >= int(self.concurrency)
+            self._in_flight -= 1
+            now = _time.monotonic()
+
+            if status in THROTTLE_STATUSES:
+                # halve at most once per round of requests that were in flight
+                if now >= self._decreased_at:
+                    self.concurrency = max(
+                        float(self.min_concurrency), self.concurrency / 2)
+                    self._decreased_at = now + (wait or BACKOFF_BASE)
+                if wait:
+                    self._paused_until = max(self._paused_until, now + wait)
+
+            elif saturated and status is not None and status < 500:
+                self.concurrency = min(
+                    float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+
+            self._cond.notify_all()
+
+
+class LimitedAdapter(_adapters.BaseAdapter):
+    """Sends through another adapter, under a `RateLimiter`, with retries"""
+
+    def __init__(self, adapter, limiter, max_retries=MAX_RETRIES):
+        # type: (_adapters.BaseAdapter, RateLimiter, int) -> None
+        super(LimitedAdapter, self).__init__()
+        self.adapter = adapter
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def send(self, request, **kwargs):
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self.adapter.send(request, **kwargs)
+            except (_requests.ConnectionError, _requests.Timeout) as exc:
+                self.limiter.release()
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                gradescope.metrics.count("retries", reason=type(exc).__name__)
+                _time.sleep(backoff(attempt))
+                attempt += 1
+                continue
+
+            status = response.status_code
+            retryable = status == 429 or (idempotent and status in RETRY_STATUSES)
+            wait = retry_after(response) if status in THROTTLE_STATUSES else None
+
+            if status in THROTTLE_STATUSES:
+                gradescope.metrics.count("throttled", status=status)
+
+            if not retryable or attempt >= self.max_retries:
+                if kwargs.get("stream"):
+                    self._release_on_close(response, status, wait)
+                else:
+                    self.limiter.release(status, wait)
+                return response
+
+            self.limiter.release(status, wait)
+            response.close()
+            gradescope.metrics.count("retries", reason=str(status))
+            _time.sleep(wait if wait is not None else backoff(attempt))
+            attempt += 1
+
+    def _release_on_close(self, response, status, wait):
+        # The body of a streamed response is read after send returns: keep
+        # the slot until the connection goes back to the pool, which happens
+        # when the body is exhausted or the response is closed
+        lock = _threading.Lock()
+        released = []
+
+        def release():
+            with lock:
+                if released:
+                    return
+                released.append(True)
+            self.limiter.release(status, wait)
+
+        release_conn = getattr(response.raw, "release_conn", None)
+        if release_conn is None:
+            release()
+            return
+
+        def release_conn_and_slot():
+            try:
+                release_conn()
+            finally:
+                release()
+
+        response.raw.release_conn = release_conn_and_slot
+        # a response dropped without being closed must not hold a slot forever
+        _weakref.finalize(response, release)
+
+    def close(self):
+        self.adapter.close()
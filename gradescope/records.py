@@ -0,0 +1,114 @@
+"""
+Compact grade records for large assignments.
+
+`collapse_grades` makes two dicts per student (the housekeeping columns and
+the questions), on top of the dict `csv.DictReader` already made. Here, the
+column names are kept once per assignment, in a `GradeLayout` shared by all
+of its rows. Each `GradeRecord` is a `__slots__` object holding a tuple of
+housekeeping values and an `array` of question scores.
+
+Records read like the collapsed dicts: `record["Email"]`,
+`record["Total Score"]`, `record["questions"]`. `to_dict()` returns exactly
+what `collapse_grades` + `to_numeric` would have.
+"""
+
+import array as _array
+import csv as _csv
+import typing as _typing
+
+from gradescope.raw_util import robust_float
+from gradescope.util import NUM_HOUSEKEEPING_COLS
+
+# Housekeeping columns turned into floats, like get_assignment_grades does
+NUMERIC_FIELDS = ("Total Score", "Max Points", "View Count")
+
+
+class GradeLayout(object):
+    """The column names of one scores.csv, shared by all of its records"""
+
+    __slots__ = ("housekeeping", "questions", "position", "question_position", "numeric")
+
+    def __init__(self, fieldnames):
+        # type: (_typing.List[str]) -> None
+        self.housekeeping = tuple(fieldnames[:NUM_HOUSEKEEPING_COLS])
+        self.questions = tuple(fieldnames[NUM_HOUSEKEEPING_COLS:])
+        self.position = {name: i for i, name in enumerate(self.housekeeping)}
+        self.question_position = {name: i for i, name in enumerate(self.questions)}
+        self.numeric = frozenset(
+            i for i, name in enumerate(self.housekeeping) if name in NUMERIC_FIELDS)
+
+    def record(self, row):
+        # type: (_typing.List[str]) -> GradeRecord
+        """The record for one CSV row (a list of strings)."""
+        size = len(self.housekeeping)
+        values = tuple(
+            robust_float(value) if i in self.numeric else value
+            for i, value in enumerate(row[:size])
+        )
+        scores = _array.array("d", [robust_float(value) for value in row[size:]])
+        return GradeRecord(self, values, scores)
+
+
+class GradeRecord(object):
+
+    __slots__ = ("layout", "values", "scores")
+
+    def __init__(self, layout, values, scores):
+        # type: (GradeLayout, tuple, _array.array) -> None
+        self.layout = layout
+        self.values = values
+        self.scores = scores
+
+    def __getitem__(self, key):
+        # type: (str) -> _typing.Any
+        if key == "questions":
+            return self.questions
+        return self.values[self.layout.position[key]]
+
+    def get(self, key, default=None):
+        # type: (str, _typing.Any) -> _typing.Any
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
+
+    def score(self, question):
+        # type: (str) -> float
+        return self.scores[self.layout.question_position[question]]
+
+    @property
+    def questions(self):
+        # type: () -> _typing.Dict[str, float]
+        """{question name: score}, built on demand."""
+        return dict(zip(self.layout.questions, self.scores))
+
+    def to_dict(self):
+        # type: () -> dict
+        """The record in the shape `get_assignment_grades` returns."""
+        collapsed = dict(zip(self.layout.housekeeping, self.values))
+        collapsed["questions"] = self.questions
+        return collapsed
+
+    def __repr__(self):
+        return "<GradeRecord {} {}>".format(self.get("Email"), self.get("Total Score"))
+
+
+def read_grade_records(lines):
+    # type: (_typing.Iterable[str]) -> _typing.Iterator[GradeRecord]
+    """Parse a scores.csv, given as lines, into records sharing one layout."""
+    reader = _csv.reader(
+        lines,
+        quotechar='"',
+        delimiter=",",
+        quoting=_csv.QUOTE_ALL,
+        skipinitialspace=True,
+    )
+
+    fieldnames = next(reader, None)
+    if fieldnames is None:
+        return
+
+    layout = GradeLayout(fieldnames)
+    for row in reader:
+        if row:
+            yield layout.record(row)
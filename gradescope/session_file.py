@@ -0,0 +1,149 @@
+"""
+Persist Gradescope login cookies between runs.
+
+The cookies of a successful login are written to `SESSION_FILE` (readable by
+the owner only) along with the username and an expiry, so later processes and
+parallel workers can reuse them instead of logging in again. `login_lock`
+serializes logins across processes, so a fan-out of workers performs a single
+login between them.
+"""
+
+import contextlib as _contextlib
+import json as _json
+import os as _os
+import tempfile as _tempfile
+import time as _time
+import typing as _typing
+
+try:
+    import fcntl as _fcntl
+except ImportError:  # pragma: no cover
+    # Windows: no cross-process locking, each process may log in itself
+    _fcntl = None
+
+
+SESSION_FILE = _os.path.join(
+    _os.path.expanduser("~"), ".cache", "gradescope", "session.json")
+
+# How long a saved login is trusted when its cookies don't say otherwise
+SESSION_TTL = 12 * 60 * 60
+
+
+def cookie_records(jar):
+    # type: (_typing.Iterable) -> _typing.List[dict]
+    return [
+        {
+            "name": cookie.name,
+            "value": cookie.value,
+            "domain": cookie.domain,
+            "path": cookie.path,
+            "expires": cookie.expires,
+        }
+        for cookie in jar
+    ]
+
+
+def restore_cookies(cookies, records):
+    # type: (_typing.Any, _typing.List[dict]) -> None
+    """Add saved cookies to a requests or httpx cookie container."""
+    for record in records:
+        cookies.set(
+            record["name"],
+            record["value"],
+            domain=record["domain"],
+            path=record["path"],
+        )
+
+
+def save(username, data, records, path=None):
+    # type: (str, dict, _typing.List[dict], _typing.Optional[str]) -> None
+    path = path or SESSION_FILE
+
+    expires_at = _time.time() + SESSION_TTL
+    cookie_expiries = [r["expires"] for r in records if r["expires"]]
+    if cookie_expiries:
+        expires_at = min([expires_at] + cookie_expiries)
+
+    content = _json.dumps({
+        "username": username,
+        "expires_at": expires_at,
+        "authenticity_token": data.get("authenticity_token"),
+        "cookies": records,
+    })
+
+    directory = _os.path.dirname(path)
+    _os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    # mkstemp creates the file with 0600 permissions
+    fd, tmp_path = _tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with _os.fdopen(fd, "w") as f:
+        f.write(content)
+        f.flush()
+        _os.fsync(f.fileno())
+    _os.replace(tmp_path, path)
+
+
+def load(username, path=None):
+    # type: (str, _typing.Optional[str]) -> _typing.Optional[dict]
+    """Return the saved login of `username`, or None if missing or expired."""
+    path = path or SESSION_FILE
+
+    try:
+        with open(path) as f:
+            saved = _json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if saved.get("username") != username:
+        return None
+
+    if saved.get("expires_at", 0) <= _time.time():
+        return None
+
+    return saved
+
+
+def clear(cookies=None, path=None):
+    # type: (_typing.Optional[_typing.List[dict]], _typing.Optional[str]) -> None
+    """
+    Remove the saved login. If `cookies` is given, only remove it if it still
+    holds those cookies, so a fresh login saved by another process is kept.
+    """
+    path = path or SESSION_FILE
+
+    if cookies is not None:
+        saved = load_any(path)
+        if saved is None or saved.get("cookies") != cookies:
+            return
+
+    try:
+        _os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def load_any(path=None):
+    # type: (_typing.Optional[str]) -> _typing.Optional[dict]
+    try:
+        with open(path or SESSION_FILE) as f:
+            return _json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@_contextlib.contextmanager
+def login_lock(path=None):
+    """Hold an exclusive lock across processes while logging in."""
+    path = path or SESSION_FILE
+
+    if _fcntl is None:
+        yield
+        return
+
+    _os.makedirs(_os.path.dirname(path), mode=0o700, exist_ok=True)
+    with open(path + ".lock", "a") as lock_file:
+        _fcntl.flock(lock_file, _fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            _fcntl.flock(lock_file, _fcntl.LOCK_UN)
@@ -1,4 +1,5 @@
 
+import codecs as _codecs
 import csv as _csv
 import os as _os
 import io as _io
@@ -20,6 +21,29 @@ def parse_csv(content):
     ]
     return records
 
+def iter_lines(chunks):
+    """Decode chunks of UTF-8 bytes into lines, keeping the line endings"""
+    decoder = _codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+def iter_csv(chunks):
+    """Like parse_csv, for a body arriving in chunks, one record at a time"""
+    return _csv.DictReader(
+        iter_lines(chunks),
+        quotechar='"',
+        delimiter=',',
+        quoting=_csv.QUOTE_ALL,
+        skipinitialspace=True)
+
 def extract_evaluations(td, content):
     with _io.BytesIO(content) as tmp_zip:
         with _zipfile.ZipFile(tmp_zip) as zf:
@@ -35,6 +59,32 @@ def extract_evaluations(td, content):
 
     return _os.path.join(td, extracted_files[0])
 
+def evaluation_sheets(zf):
+    """The question sheets of an evaluations export, {sheet name: zip member}, read in place"""
+    folders = {name.split('/')[0] for name in zf.namelist() if '/' in name}
+    folders = [folder for folder in folders if folder[0] != '.']
+
+    if len(folders) != 1:
+        raise FileNotFoundError(f"Evaluations for assignment did not contain expected directory structure")
+
+    prefix = folders[0] + '/'
+    sheets = {}
+    for name in zf.namelist():
+        sheet = name[len(prefix):]
+        if name.startswith(prefix) and '/' not in sheet and '.csv' in sheet:
+            sheets[sheet] = name
+    return sheets
+
+def read_evaluation_sheet(zf, member):
+    """The rows of one evaluations sheet, decompressed as they are read"""
+    with zf.open(member) as f:
+        yield from _csv.DictReader(
+            _io.TextIOWrapper(f, encoding='utf-8', newline=''),
+            quotechar='"',
+            delimiter=',',
+            quoting=_csv.QUOTE_ALL,
+            skipinitialspace=True)
+
 def to_numeric(dictlist, fields):
     for elt in dictlist:
         for field in fields:
@@ -51,22 +101,20 @@ def shortened_grade_record(record):
         "id": record.get("Submission ID", None),
     }
 
-def collapse_grades(grades):
-    if len(grades) == 0:
-        return []
-
-    keys = list(grades[0].keys())
+def collapse_grade(person):
+    keys = list(person.keys())
     housekeeping = keys[:NUM_HOUSEKEEPING_COLS]
     sections = keys[NUM_HOUSEKEEPING_COLS:]
 
-    collapsed = [{k: person[k] for k in housekeeping} for person in grades]
-
-    for i, person in enumerate(grades):
-        collapsed[i]['questions'] = {k: person[k] for k in sections}
-        to_numeric([collapsed[i]['questions']], sections)
+    collapsed = {k: person[k] for k in housekeeping}
+    collapsed['questions'] = {k: person[k] for k in sections}
+    to_numeric([collapsed['questions']], sections)
 
     return collapsed
 
+def collapse_grades(grades):
+    return [collapse_grade(person) for person in grades]
+
 def map_sheets(sheets, questions):
     q_names = {question.split(':')[0] if ':' in question else question.split(' ')[0]: question for question in questions}
     sheet_map = {}
@@ -0,0 +1,104 @@
+"""
+Content-addressed, size-bounded disk cache for assignment images.
+
+Image bytes are stored once per sha256 under objects/, and every /files/...
+path maps to the hash of its content under paths/, so an image shared by
+cloned courses is stored once and an image seen on an earlier run is not
+downloaded again. Least recently used objects are evicted past max_bytes.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "paths"), exist_ok=True)
+
+        # content hash -> [size, last used]
+        self.index = {}
+        for digest in os.listdir(os.path.join(directory, "objects")):
+            if digest.endswith(".tmp"):
+                continue
+            stat = os.stat(self._object_filename(digest))
+            self.index[digest] = [stat.st_size, stat.st_mtime]
+
+    def _object_filename(self, digest):
+        return os.path.join(self.directory, "objects", digest)
+
+    def _path_filename(self, path):
+        key = hashlib.sha256(path.encode()).hexdigest()
+        return os.path.join(self.directory, "paths", key)
+
+    def _write_atomic(self, filename, content):
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=os.path.dirname(filename), suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_filename, filename)
+
+    def digest(self, path):
+        """The content hash last stored for the image at path, or None
+
+        Kept even when the image itself has been evicted."""
+        try:
+            with open(self._path_filename(path)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def get(self, path):
+        """The cached bytes of the image at path, or None"""
+        try:
+            with open(self._path_filename(path)) as f:
+                digest = f.read().strip()
+            with open(self._object_filename(digest), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        now = time.time()
+        with self.lock:
+            if digest in self.index:
+                self.index[digest][1] = now
+        try:
+            os.utime(self._object_filename(digest), (now, now))
+        except OSError:
+            # evicted since it was read, by another thread or process
+            return None
+        return content
+
+    def put(self, path, content):
+        """Store the image at path, returning its content hash"""
+        digest = hashlib.sha256(content).hexdigest()
+
+        with self.lock:
+            if digest not in self.index:
+                self._write_atomic(self._object_filename(digest), content)
+            self.index[digest] = [len(content), time.time()]
+            self._write_atomic(self._path_filename(path), digest.encode())
+            self._evict(keep=digest)
+
+        return digest
+
+    def _evict(self, keep):
+        total = sum(size for size, _ in self.index.values())
+        for digest, (size, _) in sorted(self.index.items(), key=lambda x: x[1][1]):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            # path entries pointing here now miss, and are refetched
+            os.remove(self._object_filename(digest))
+            del self.index[digest]
+            total -= size
@@ -0,0 +1,93 @@
+"""
+Shrink assignment images to what the printed page can show.
+
+An image in question text is laid out at the full printable width, so any
+pixels past that width at TARGET_DPI are never seen on paper but are still
+embedded in the pdf. prepare_image downsamples such images and re-encodes
+them: images with few colors or transparency as an optimized (palette) PNG,
+opaque photos as JPEG when that is much smaller. An image that cannot be
+made smaller is returned unchanged.
+"""
+import io
+
+from PIL import Image
+
+TARGET_DPI = 200
+JPEG_QUALITY = 88
+
+# a photo is stored as jpeg only when that is this much smaller than png
+JPEG_ADVANTAGE = 0.5
+
+MM_PER_INCH = 25.4
+
+# formats fpdf embeds through Pillow; anything else (svg) is left alone
+PREPARED_FORMATS = {"PNG", "JPEG", "GIF", "BMP", "WEBP", "TIFF"}
+
+
+def target_width_px(width_mm, dpi=TARGET_DPI):
+    """The pixel width that prints width_mm wide at dpi"""
+    return round(width_mm / MM_PER_INCH * dpi)
+
+
+def _encode(image, format, **params):
+    out = io.BytesIO()
+    image.save(out, format=format, **params)
+    return out.getvalue()
+
+
+def _has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA", "La", "RGBa") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def _png(image, colors):
+    if image.mode == "RGB" and colors is not None:
+        # few distinct colors (diagrams, flat screenshots): an exact palette
+        palette = Image.new("P", (1, 1))
+        palette.putpalette([channel for _, rgb in colors for channel in rgb])
+        image = image.quantize(palette=palette, dither=Image.Dither.NONE)
+    return _encode(image, "PNG", optimize=True)
+
+
+def prepare_image(content, width_px):
+    """The image bytes in content, downsampled to at most width_px wide
+
+    Returns content itself when the image is unreadable, or when neither
+    downsampling nor re-encoding makes it smaller."""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return content
+    if image.format not in PREPARED_FORMATS:
+        return content
+
+    source_format = image.format
+    resized = image.width > width_px
+    if not resized and source_format == "JPEG":
+        # re-encoding a jpeg at the same size only loses quality
+        return content
+
+    if image.mode not in ("L", "LA", "RGB", "RGBA"):
+        image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+    if resized:
+        height = max(1, round(image.height * width_px / image.width))
+        image = image.resize((width_px, height), Image.Resampling.LANCZOS)
+
+    colors = image.getcolors(256)
+    if _has_alpha(image):
+        candidates = [_png(image, colors)]
+    elif source_format == "JPEG":
+        candidates = [_encode(image, "JPEG", quality=JPEG_QUALITY, optimize=True)]
+    else:
+        png = _png(image, colors)
+        candidates = [png]
+        if colors is None:
+            jpeg = _encode(image, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            if len(jpeg) < len(png) * JPEG_ADVANTAGE:
+                candidates = [jpeg]
+
+    # a flat screenshot can compress better at full size than resampled
+    candidates.append(content)
+    return min(candidates, key=len)
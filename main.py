@@ -1,17 +1,51 @@
 #!/usr/bin/env python
+import argparse
+import collections
+import copy
+import functools
+import hashlib
+import io
 import json
+import multiprocessing
 import os
 import re
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
 
-import requests
+from fontTools import ttLib
 from fpdf import FPDF  # this is fpdf2
-
+from fpdf.fonts import SubsetMap
+
+from export_state import ExportState
+from image_cache import ImageCache
+from image_prep import prepare_image, target_width_px
+import gradescope.api as api
+import gradescope.metrics as metrics
+from gradescope.api import (
+    configure_rate_limit,
+    configure_session,
+    enable_cache,
+    enable_cassette,
+    login_required,
+    request,
+)
+from gradescope.exceptions import EdAPIException
 from gradescope.macros import (
+    get_assignment_submissions,
     get_assignment_template_href,
     get_assignments,
     get_courses,
     get_data_from_assignment,
     get_image,
+    submission_pdf_url,
 )
 
 
@@ -29,105 +63,393 @@ def read_json(filename):
         return json.load(f)
 
 
+@metrics.timed("disk_write")
 def write_json(filename, content):
     with open(filename, "w") as f:
         json.dump(content, f)
 
 
-def write_file(content, filename):
-    with open(filename, "wb") as f:
+CHUNK_SIZE = 1024 * 1024
+
+
+def meta_filename(filename):
+    return filename + ".meta.json"
+
+
+def finish_file(part_filename, filename, size, sha256, fingerprint=None):
+    """Record the expected size and hash, then move the file into place"""
+    meta = {"size": size, "sha256": sha256}
+    if fingerprint is not None:
+        meta["fingerprint"] = fingerprint
+    write_json(meta_filename(filename), meta)
+    os.replace(part_filename, filename)
+
+
+@metrics.timed("disk_write")
+def write_file(content, filename, fingerprint=None):
+    """Write to a temp file, fsync, then rename, so filename is never partial"""
+    part_filename = filename + ".part"
+    with open(part_filename, "wb") as f:
         f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    finish_file(
+        part_filename, filename, len(content), hashlib.sha256(content).hexdigest(),
+        fingerprint=fingerprint,
+    )
+
+
+def is_complete(filename):
+    """Whether filename exists and has the size recorded when it was written"""
+    if not os.path.exists(filename):
+        return False
+
+    size = os.path.getsize(filename)
+    if os.path.exists(meta_filename(filename)):
+        return size == read_json(meta_filename(filename))["size"]
 
+    # files saved before sizes were recorded: a complete pdf ends with %%EOF
+    with open(filename, "rb") as f:
+        f.seek(max(0, size - 1024))
+        return b"%%EOF" in f.read()
 
+
+def recorded_fingerprint(filename):
+    """The outline fingerprint saved with a generated pdf, or None"""
+    if not os.path.exists(meta_filename(filename)):
+        return None
+    return read_json(meta_filename(filename)).get("fingerprint")
+
+
+def sha256_file(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+
+@metrics.timed("download")
 def download_file_to_loc(href, filename):
-    response = requests.get(href)
-    write_file(response.content, filename)
+    """Stream href to filename, resuming a partial download if there is one"""
+    part_filename = filename + ".part"
+    part_meta_filename = part_filename + ".json"
+
+    # resume only if we know which version of the file the part belongs to
+    offset = 0
+    headers = {}
+    if os.path.exists(part_filename) and os.path.exists(part_meta_filename):
+        part_meta = read_json(part_meta_filename)
+        if part_meta.get("validator"):
+            offset = os.path.getsize(part_filename)
+            if offset and offset == part_meta.get("size"):
+                # stopped after the last byte, before the rename
+                os.remove(part_meta_filename)
+                finish_file(
+                    part_filename, filename, offset,
+                    sha256_file(part_filename).hexdigest(),
+                )
+                return
+            headers = {"Range": f"bytes={offset}-", "If-Range": part_meta["validator"]}
+
+    # through request, so an expired login is renewed in the middle of a long run
+    try:
+        response = request(url=href, headers=headers, stream=True)
+    except EdAPIException as exc:
+        if not headers or exc.data.get("http_code") != 416:
+            raise
+        # the part does not fit the file on the server: start over
+        os.remove(part_filename)
+        offset = 0
+        response = request(url=href, stream=True)
+
+    with response:
+        # a page that still needs a login sends us to the login form, not the file
+        if login_required(response):
+            raise Exception(f"not logged in, cannot download {href}")
+
+        # the server ignored the range (or the file changed): start over
+        if response.status_code != 206:
+            offset = 0
+
+        validator = response.headers.get("ETag") or response.headers.get(
+            "Last-Modified"
+        )
+        expected_size = None
+        if response.headers.get("Content-Encoding", "identity") == "identity":
+            if "Content-Length" in response.headers:
+                expected_size = offset + int(response.headers["Content-Length"])
+
+        write_json(part_meta_filename, {"validator": validator, "size": expected_size})
+
+        digest = sha256_file(part_filename) if offset else hashlib.sha256()
+        with open(part_filename, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                metrics.count("bytes_received", len(chunk), source="download")
+                with metrics.phase("disk_write"):
+                    f.write(chunk)
+                digest.update(chunk)
+            with metrics.phase("disk_write"):
+                f.flush()
+                os.fsync(f.fileno())
+
+    size = os.path.getsize(part_filename)
+    if expected_size is not None and size != expected_size:
+        raise Exception(
+            f"incomplete download of {href}: {size} of {expected_size} bytes"
+        )
+
+    os.remove(part_meta_filename)
+    finish_file(part_filename, filename, size, digest.hexdigest())
+
+
+IMAGE_JOBS = 8
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
 
 
-def download_images(text):
-    image_pattern = r"!\[([^\]]*)\]\((/files/[^)]+)\)"
-    downloaded_images = {}
+def image_cache():
+    """The image cache in TARGET_DIR, shared by all assignments"""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(TARGET_DIR + "/.image-cache")
+        return _image_cache
 
-    for match in re.finditer(image_pattern, text):
-        alt_text, file_path = match.groups()
-        local_filename = "tmp/" + os.path.basename(file_path)
 
+@metrics.timed("image_fetch")
+def fetch_image(file_path):
+    cache = image_cache()
+    content = cache.get(file_path)
+    if content is None:
+        metrics.count("image_cache", result="miss")
         result = get_image(file_path)
         if not result:
             raise Exception("no image?")
-        with open(local_filename, "wb") as f:
-            f.write(result.content)
-            downloaded_images[file_path] = local_filename
+        content = result.content
+        cache.put(file_path, content)
+    else:
+        metrics.count("image_cache", result="hit")
+    return content
+
+
+# images are laid out at the full width of an A4 page less its 10mm margins
+IMAGE_WIDTH_PX = target_width_px(210 - 2 * 10)
+
+
+@metrics.timed("image_prepare")
+def prepared_image(content):
+    """The image downsampled for the page, cached by the hash of content"""
+    cache = image_cache()
+    key = f"prepared:{IMAGE_WIDTH_PX}:{hashlib.sha256(content).hexdigest()}"
+    prepared = cache.get(key)
+    if prepared is None:
+        prepared = prepare_image(content, IMAGE_WIDTH_PX)
+        cache.put(key, prepared)
+    return prepared
+
+
+def image_hashes(file_paths):
+    """The sha256 of each image's original bytes, fetching those not yet cached"""
+    cache = image_cache()
+    missing = [path for path in file_paths if cache.digest(path) is None]
+    if missing:
+        with ThreadPoolExecutor(max_workers=IMAGE_JOBS) as pool:
+            list(pool.map(fetch_image, missing))
+    return {path: cache.digest(path) for path in file_paths}
+
+
+def download_images(file_paths):
+    """Fetch and prepare the images at file_paths concurrently, returning {path: bytes}"""
+    with ThreadPoolExecutor(max_workers=IMAGE_JOBS) as pool:
+        images = pool.map(lambda path: prepared_image(fetch_image(path)), file_paths)
+        return dict(zip(file_paths, images))
+
+
+QUESTION_FONT = ("CMU Serif", "B", 14)
+JR_QUESTION_FONT = ("CMU Serif", "B", 12)
+TEXT_FONT = ("Latin Modern Roman", "", 12)
+CHOICE_FONT = ("Latin Modern Roman", "", 12)
+CODE_FONT = ("Latin Modern Mono", "", 12)
+
+MARKUP_PATTERN = re.compile(
+    r"(?P<code_block>```[\s\S]*?```)"
+    r"|(?P<inline_code>`[^`\n]+`)"
+    r"|(?P<image>!\[[^\]]*\]\((?P<image_path>/files/[^)]+)\))"
+)
+
+# render plan steps: (kind, font, value)
+WRITE = "write"
+CODE_BLOCK = "code_block"
+IMAGE = "image"
+
+
+@functools.lru_cache(maxsize=4096)
+def render_plan(text, font):
+    """Tokenize markup text in one pass into a tuple of render steps
+
+    Adjacent writes in the same font are merged into one step."""
+    plan = []
+
+    def write(step_font, value):
+        if not value:
+            return
+        if plan and plan[-1][0] == WRITE and plan[-1][1] == step_font:
+            plan[-1] = (WRITE, step_font, plan[-1][2] + value)
+        else:
+            plan.append((WRITE, step_font, value))
+
+    position = 0
+    for match in MARKUP_PATTERN.finditer(text):
+        write(font, text[position : match.start()])
+        if match.group("code_block"):
+            plan.append((CODE_BLOCK, CODE_FONT, match.group().strip("`").strip()))
+        elif match.group("inline_code"):
+            write(CODE_FONT, match.group().strip("`"))
+        else:
+            plan.append((IMAGE, None, match.group("image_path")))
+        position = match.end()
+    write(font, text[position:])
+
+    return tuple(plan)
 
-    return downloaded_images
+
+def image_paths(data):
+    """The distinct images referenced by the question text of an assignment"""
+    paths = []
+    for question in data["questions"].values():
+        for content in question["content"]:
+            if content["type"] == "text":
+                paths += [
+                    value
+                    for kind, _, value in render_plan(content["value"], TEXT_FONT)
+                    if kind == IMAGE
+                ]
+    return list(dict.fromkeys(paths))
+
+
+def outline_fingerprint(data, hashes):
+    """A hash of everything a generated pdf is made from
+
+    The title and questions tree, in canonical JSON, and the hashes of the
+    original images they reference (from image_hashes). The prepared images
+    are left out, so a new Pillow or image size does not change it."""
+    outline = {"title": data.get("title"), "questions": data["questions"]}
+    digest = hashlib.sha256(
+        json.dumps(outline, sort_keys=True, separators=(",", ":")).encode()
+    )
+    for path in sorted(hashes):
+        digest.update(f"{path}\0{hashes[path]}\0".encode())
+    return digest.hexdigest()
 
 
 def format_text(pdf, text, font, downloaded_images):
-    # Simplified patterns without capture groups
-    code_block_pattern = r"```[\s\S]*?```"
-    inline_code_pattern = r"`[^`\n]+`"
-    image_pattern = r"!\[[^\]]*\]\(/files/[^)]+\)"
-
-    # Combine patterns
-    combined_pattern = f"{code_block_pattern}|{inline_code_pattern}|{image_pattern}"
-
-    # Split the text into parts
-    parts = re.split(f"({combined_pattern})", text)
-
-    for part in parts:
-        if part.startswith("```") and part.endswith("```"):
-            # Code block
-            pdf.set_font("Latin Modern Mono", "", 12)
-            code = part.strip("`").strip()
-            pdf.multi_cell(0, text=code)
-            pdf.set_font(*font)
-        elif part.startswith("`") and part.endswith("`"):
-            # Inline code
-            pdf.set_font("Latin Modern Mono", "", 12)
-            code = part.strip("`")
-            pdf.write(text=code)
-            pdf.set_font(*font)
-        elif part.startswith("!") and part.endswith(")"):
-            # Image
-            img_match = re.match(r"!\[([^\]]*)\]\((/files/[^)]+)\)", part)
-            if not img_match:
-                raise Exception("wait, no image?")
-            alt_text, file_path = img_match.groups()
-            image_file = downloaded_images[file_path]
+    current_font = None
+    for kind, step_font, value in render_plan(text, font):
+        if kind == IMAGE:
+            image = io.BytesIO(downloaded_images[value])
             img_width = pdf.w - 2 * pdf.l_margin  # Full width minus margins
-            pdf.image(image_file, x=pdf.l_margin, w=img_width)
+            pdf.image(image, x=pdf.l_margin, w=img_width)
+            continue
+
+        if step_font != current_font:
+            pdf.set_font(*step_font)
+            current_font = step_font
+
+        if kind == CODE_BLOCK:
+            pdf.multi_cell(0, text=value)
         else:
-            # Normal text
-            pdf.set_font(*font)
-            pdf.write(text=part)
+            pdf.write(text=value)
+
+
+CUSTOM_FONTS = {
+    ("CMU Serif", ""): "fonts/cmu-serif/cmunrm.ttf",
+    ("CMU Serif", "B"): "fonts/cmu-serif/cmunbx.ttf",
+    ("Latin Modern Roman", ""): "fonts/latin-modern-roman/lmroman10-regular.otf",
+    ("Latin Modern Roman", "B"): "fonts/latin-modern-roman/lmroman10-bold.otf",
+    ("Latin Modern Mono", ""): "fonts/latin-modern-roman/lmmono10-regular.otf",
+}
+
+# (family, style) -> (parsed font, font file bytes), shared by all pdfs
+_parsed_fonts = {}
+_parsed_fonts_lock = threading.Lock()
+
+
+def parsed_font(family, style):
+    """Parse a custom font once per process"""
+    key = (family, style)
+    with _parsed_fonts_lock:
+        if key not in _parsed_fonts:
+            filename = CUSTOM_FONTS[key]
+            scratch = FPDF()
+            scratch.add_font(family, style, filename)
+            with open(filename, "rb") as f:
+                content = f.read()
+            _parsed_fonts[key] = (scratch.fonts[f"{family.lower()}{style}"], content)
+        return _parsed_fonts[key]
+
+
+# The per-document state of fpdf2 2.8's TTFFont, reset on each shared copy
+# (pyproject.toml pins fpdf2 2.8.x)
+TTFFONT_DOCUMENT_STATE = (
+    "color_font", "ttfont", "biggest_size_pt", "missing_glyphs", "_hbfont", "subset"
+)
 
 
 class PDFWithCustomFonts(FPDF):
-    def __init__(self):
-        super().__init__()
-        self.add_font("CMU Serif", "", "fonts/cmu-serif/cmunrm.ttf")
-        self.add_font("CMU Serif", "B", "fonts/cmu-serif/cmunbx.ttf")
-        self.add_font(
-            "Latin Modern Roman", "", "fonts/latin-modern-roman/lmroman10-regular.otf"
-        )
-        self.add_font(
-            "Latin Modern Roman", "B", "fonts/latin-modern-roman/lmroman10-bold.otf"
-        )
-        self.add_font(
-            "Latin Modern Mono", "", "fonts/latin-modern-roman/lmmono10-regular.otf"
+    """FPDF with our custom fonts, each added the first time it is used
+
+    The metrics of a font are parsed once per process and shared; each pdf
+    gets its own font program to subset, since fpdf subsets it in place."""
+
+    def set_font(self, family=None, style="", size=0):
+        if (family, style) in CUSTOM_FONTS:
+            self.load_custom_font(family, style)
+        super().set_font(family, style, size)
+
+    def load_custom_font(self, family, style):
+        fontkey = f"{family.lower()}{style}"
+        if fontkey in self.fonts:
+            return
+
+        prototype, content = parsed_font(family, style)
+        shareable = all(hasattr(prototype, name) for name in TTFFONT_DOCUMENT_STATE)
+        if not shareable or prototype.color_font is not None:
+            # an fpdf2 whose fonts we can't share, or color glyphs, which are
+            # tied to the document: parse the font for this one
+            self.add_font(family, style, CUSTOM_FONTS[(family, style)])
+            return
+
+        font = copy.copy(prototype)
+        font.i = len(self.fonts) + 1
+        font.ttfont = ttLib.TTFont(
+            io.BytesIO(content), recalcTimestamp=False, lazy=True
         )
+        font.biggest_size_pt = 0
+        font.missing_glyphs = []
+        font._hbfont = None
+        font.subset = SubsetMap(font)
+        self.fonts[fontkey] = font
 
 
 def write_markup_to_pdf(data, filename):
     # Download any images in advance
-    all_text = ""
-    for question in data["questions"].values():
-        for content in question["content"]:
-            if content["type"] == "text":
-                all_text += content["value"] + "\n"
+    paths = image_paths(data)
+    downloaded_images = download_images(paths)
+    fingerprint = outline_fingerprint(data, image_hashes(paths))
+    render_pdf(data, filename, downloaded_images, fingerprint)
 
-    downloaded_images = download_images(all_text)
 
+def render_pdf(data, filename, downloaded_images, fingerprint=None):
+    pdf = layout_pdf(data, downloaded_images)
+    with metrics.phase("pdf_output"):
+        content = bytes(pdf.output())
+    write_file(content, filename, fingerprint=fingerprint)
+
+
+@metrics.timed("pdf_layout")
+def layout_pdf(data, downloaded_images):
     pdf = PDFWithCustomFonts()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
@@ -136,12 +458,6 @@ def write_markup_to_pdf(data, filename):
     pdf.write(text=data["title"])
     pdf.ln(10)
 
-    # Set font for the questions
-    question_font = ("CMU Serif", "B", 14)
-    jr_question_font = ("CMU Serif", "B", 12)
-    text_font = ("Latin Modern Roman", "", 12)
-    choice_font = ("Latin Modern Roman", "", 12)
-
     roots, tree = build_question_tree(data["questions"])
     sorted_questions = flatten_question_tree(roots, tree)
 
@@ -155,31 +471,27 @@ def write_markup_to_pdf(data, filename):
         )
 
         if parent_index:
-            pdf.set_font(*jr_question_font)
+            pdf.set_font(*JR_QUESTION_FONT)
         else:
-            pdf.set_font(*question_font)
+            pdf.set_font(*QUESTION_FONT)
 
         pdf.cell(0, 10, f"Q{q_number}. {question_data['title']}", 0, 1)
         pdf.ln(2)
 
         for content in question_data["content"]:
             if content["type"] == "text":
-                format_text(pdf, content["value"], text_font, downloaded_images)
+                format_text(pdf, content["value"], TEXT_FONT, downloaded_images)
             elif content["type"] == "radio_input":
                 pdf.ln(8)
                 for j, choice in enumerate(content["choices"]):
                     choice_text = f"    {chr(65 + j)}. {choice['value']}"
-                    format_text(pdf, choice_text, choice_font, downloaded_images)
+                    format_text(pdf, choice_text, CHOICE_FONT, downloaded_images)
                     pdf.ln(8)
 
         # Add more space before the next question
         pdf.ln(12)
 
-    pdf.output(filename)
-
-    # Clean up downloaded images
-    for image_file in downloaded_images.values():
-        os.remove(image_file)
+    return pdf
 
 
 def build_question_tree(questions):
@@ -217,38 +529,112 @@ def flatten_question_tree(roots, tree):
     return flattened
 
 
-def save_assignment(assignment=None, course_id=None, assignment_id=None):
+def output_filename(course_id, assignment_id):
+    return TARGET_DIR + f"/{course_id}_{assignment_id}.pdf"
+
+
+def record_outcome(state, course_id, assignment_id, status, target_loc):
+    meta = {}
+    if status != "programming" and os.path.exists(meta_filename(target_loc)):
+        meta = read_json(meta_filename(target_loc))
+    state.record(
+        course_id,
+        assignment_id,
+        status,
+        output=target_loc if status != "programming" else None,
+        size=meta.get("size"),
+        sha256=meta.get("sha256"),
+        fingerprint=meta.get("fingerprint"),
+    )
+
+
+def save_assignment(
+    assignment=None, course_id=None, assignment_id=None, state=None, sync=False
+):
+    """Save one assignment as a pdf, returning what was done with it
+
+    If state is given, the outcome (or the error) is recorded there. With
+    sync, a generated pdf is rebuilt when its outline has changed."""
     if assignment:
         course_id = assignment["course_id"]
         assignment_id = assignment["id"]
 
-    target_loc = TARGET_DIR + f"/{course_id}_{assignment_id}.pdf"
+    target_loc = output_filename(course_id, assignment_id)
 
-    if not os.path.exists(target_loc):
+    try:
+        status, render_job = fetch_assignment(
+            course_id, assignment_id, target_loc, sync=sync
+        )
+        if render_job:
+            render_assignment(*render_job)
+    except Exception as exc:
+        if state:
+            state.record(course_id, assignment_id, "failed", error=repr(exc))
+        raise
+
+    if state:
+        record_outcome(state, course_id, assignment_id, status, target_loc)
+    return status
+
+
+def fetch_assignment(course_id, assignment_id, target_loc, sync=False):
+    """The network half of saving an assignment
+
+    Returns (status, render_job); render_job is None, or the arguments for
+    render_assignment when the pdf still has to be generated.
+
+    With sync, a generated pdf that is already saved is checked against the
+    current outline, and rendered again only if its fingerprint changed.
+    Pdfs saved before fingerprints were recorded have none and are skipped."""
+    fingerprint = None
+    if is_complete(target_loc):
+        fingerprint = recorded_fingerprint(target_loc) if sync else None
+        if fingerprint is None:
+            print(f"already downloaded {target_loc}, skipping")
+            return "exists", None
+    else:
         href = get_assignment_template_href(course_id, assignment_id)
         if href:
             print(f"saving {target_loc}")
             download_file_to_loc(href, filename=target_loc)
-        else:
-            # if there is not a download pdf link, fetch the markdown contents of the assignment instead
-            data = get_data_from_assignment(
-                course_id=course_id, assignment_id=assignment_id
-            )
-            assignment_type = data.get("assignment").get("type")
-
-            if assignment_type == "ProgrammingAssignment":
-                print("programming assignment, skipping", course_id, assignment_id)
-                return
-            if data.get("questions"):
-                # question data exists
-                # turn them into a pdf
-                print(f"generating {target_loc}")
-                write_markup_to_pdf(data, filename=target_loc)
-            else:
-                print("not sure how to handle assignment type", data)
-                exit()
+            return "downloaded", None
+
+    # if there is not a download pdf link, fetch the markdown contents of the assignment instead
+    data = get_data_from_assignment(course_id=course_id, assignment_id=assignment_id)
+    assignment_type = data.get("assignment").get("type")
+
+    if assignment_type == "ProgrammingAssignment":
+        print("programming assignment, skipping", course_id, assignment_id)
+        return "programming", None
+    if data.get("questions"):
+        # question data exists
+        paths = image_paths(data)
+        new_fingerprint = outline_fingerprint(data, image_hashes(paths))
+        if new_fingerprint == fingerprint:
+            print(f"{target_loc} is up to date, skipping")
+            return "exists", None
+        # fetch the images, the pdf is made by render_assignment
+        downloaded_images = download_images(paths)
+        return "generated", (data, downloaded_images, target_loc, new_fingerprint)
     else:
-        print(f"already downloaded {target_loc}, skipping")
+        raise Exception(f"not sure how to handle assignment type {data}")
+
+
+def render_assignment(data, downloaded_images, target_loc, fingerprint=None):
+    """The CPU half of saving an assignment: turn the questions into a pdf"""
+    print(f"generating {target_loc}")
+    render_pdf(data, target_loc, downloaded_images, fingerprint)
+
+
+def render_assignment_job(data, downloaded_images, target_loc, fingerprint=None):
+    """render_assignment in a renderer process, returning the metrics it recorded"""
+    metrics.reset()
+    render_assignment(data, downloaded_images, target_loc, fingerprint)
+    return metrics.snapshot()
+
+
+def open_state():
+    return ExportState(TARGET_DIR + "/state.sqlite3")
 
 
 def fetch_courses():
@@ -256,6 +642,8 @@ def fetch_courses():
     courses = get_courses()
     filename = TARGET_DIR + "/courses.json"
     write_json(content=courses, filename=filename)
+    with open_state() as state:
+        state.add_courses(courses)
 
 
 def fetch_assignments():
@@ -268,23 +656,279 @@ def fetch_assignments():
     assignments = get_assignments([course["id"] for course in courses])
     filename = TARGET_DIR + "/assignments.json"
     write_json(content=assignments, filename=filename)
+    with open_state() as state:
+        state.add_assignments(assignments)
 
 
-def save_assignments():
-    """save all your assignments as pdfs"""
-    # read in the assignments
+def save_assignments(jobs=1, retry_failed=False, render_jobs=None, sync=False):
+    """save all your assignments as pdfs
+
+    Up to `jobs` assignments are fetched at once on threads, and pdfs are
+    rendered on `render_jobs` processes (one per cpu by default). At most two
+    renders per process wait in line; fetching pauses when they fall behind.
+
+    Only assignments that are pending or failed in the state database are
+    attempted; with retry_failed, only the failed ones. With sync, generated
+    pdfs are also checked, and rebuilt only where the outline changed."""
+    # read in the assignments; edits to the json are picked up by the state
     filename = TARGET_DIR + "/assignments.json"
-    assignments = read_json(filename=filename)
+    with open_state() as state:
+        state.add_assignments(read_json(filename=filename))
+        assignments = state.planned(
+            only_failed=retry_failed, sync=sync, output_filename=output_filename
+        )
 
-    # save the assignments as pdfs
-    for assignment in assignments:
-        save_assignment(assignment)
+        # every worker needs its own pooled connection
+        if jobs > api.POOL_MAXSIZE:
+            configure_session(pool_maxsize=jobs)
+
+        render_jobs = render_jobs or os.cpu_count()
+        render_slots = threading.BoundedSemaphore(2 * render_jobs)
+
+        # save the assignments as pdfs; a failure is reported, not fatal
+        counts = collections.Counter()
+        failures = []
+        start = time.perf_counter()
+
+        def finish(assignment, status):
+            course_id, assignment_id = assignment["course_id"], assignment["id"]
+            record_outcome(
+                state, course_id, assignment_id, status,
+                output_filename(course_id, assignment_id),
+            )
+            counts[status] += 1
+
+        def fail(assignment, exc):
+            state.record(
+                assignment["course_id"], assignment["id"], "failed", error=repr(exc)
+            )
+            counts["failed"] += 1
+            failures.append(assignment)
+            print("failed", assignment["course_id"], assignment["id"], repr(exc))
+
+        # spawn, not fork: the fetch threads may hold locks when a renderer starts
+        spawn = multiprocessing.get_context("spawn")
+
+        def start_renderers():
+            return ProcessPoolExecutor(max_workers=render_jobs, mp_context=spawn)
+
+        # the current pool is last; a pool breaks when a renderer dies
+        renderers = [start_renderers()]
+        renderers_lock = threading.Lock()
+
+        def submit_render(render_job):
+            render_slots.acquire()
+            try:
+                with renderers_lock:
+                    pool = renderers[-1]
+                try:
+                    render = pool.submit(render_assignment_job, *render_job)
+                except BrokenProcessPool:
+                    # a renderer died (out of memory, a crash): its renders
+                    # fail, later ones go to a new pool
+                    with renderers_lock:
+                        if renderers[-1] is pool:
+                            renderers.append(start_renderers())
+                        pool = renderers[-1]
+                    render = pool.submit(render_assignment_job, *render_job)
+            except BaseException:
+                render_slots.release()
+                raise
+            render.add_done_callback(lambda _: render_slots.release())
+            return render
+
+        def fetch(assignment):
+            course_id, assignment_id = assignment["course_id"], assignment["id"]
+            status, render_job = fetch_assignment(
+                course_id, assignment_id, output_filename(course_id, assignment_id),
+                sync=sync,
+            )
+            if render_job is None:
+                return status, None
+            return status, submit_render(render_job)
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as fetchers:
+                # future -> (assignment, status once rendered)
+                pending = {
+                    fetchers.submit(fetch, assignment): (assignment, None)
+                    for assignment in assignments
+                }
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        assignment, rendered_status = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as exc:
+                            fail(assignment, exc)
+                            continue
+
+                        if rendered_status is not None:
+                            metrics.merge(result)
+                            finish(assignment, rendered_status)
+                            continue
+
+                        status, render = result
+                        if render is None:
+                            finish(assignment, status)
+                        else:
+                            pending[render] = (assignment, status)
+        finally:
+            for pool in renderers:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        print(
+            f"{len(assignments)} assignments in {elapsed:.1f}s "
+            f"({len(assignments) / max(elapsed, 1e-9):.2f}/s): {summary}"
+        )
+        return failures
+
+
+def submissions_dir(course_id, assignment_id):
+    return TARGET_DIR + f"/submissions/{course_id}_{assignment_id}"
+
+
+def save_submissions(course_id, assignment_id, jobs=8):
+    """save the graded pdf of every submission to an assignment
+
+    Up to `jobs` pdfs stream to disk at once, each written atomically, and
+    ones already saved by an earlier run are skipped. The list of
+    submissions (who submitted which id) is saved next to them."""
+    submissions = get_assignment_submissions(course_id, assignment_id)
+    directory = submissions_dir(course_id, assignment_id)
+    os.makedirs(directory, exist_ok=True)
+    write_json(directory + "/submissions.json", submissions)
+
+    # every worker needs its own pooled connection
+    if jobs > api.POOL_MAXSIZE:
+        configure_session(pool_maxsize=jobs)
+
+    def save(submission):
+        filename = f"{directory}/{submission['id']}.pdf"
+        if is_complete(filename):
+            return "exists"
+        download_file_to_loc(submission_pdf_url(submission), filename)
+        return "downloaded"
+
+    counts = collections.Counter()
+    failures = []
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(save, submission): submission for submission in submissions}
+        for future in as_completed(futures):
+            submission = futures[future]
+            try:
+                counts[future.result()] += 1
+            except Exception as exc:
+                counts["failed"] += 1
+                failures.append(submission)
+                print("failed", course_id, assignment_id, submission["id"], repr(exc))
+
+    elapsed = time.perf_counter() - start
+    summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+    print(
+        f"{len(submissions)} submissions in {elapsed:.1f}s "
+        f"({len(submissions) / max(elapsed, 1e-9):.2f}/s) to {directory}: {summary}"
+    )
+    return failures
+
+
+def verify_outputs(jobs=1):
+    """re-hash every saved pdf, queueing missing or corrupt ones to be saved again"""
+    with open_state() as state:
+        broken = state.verify(jobs=jobs, output_filename=output_filename)
+    for row in broken:
+        print("needs saving again", row["output"])
+    print(f"{len(broken)} outputs missing or corrupt")
+    return broken
+
+
+def write_metrics(directory):
+    """Export the phase timings and counters of this run for dashboards"""
+    summary = metrics.snapshot()
+    metrics.write_json(directory + "/metrics.json", summary)
+    metrics.write_prometheus(directory + "/metrics.prom", summary)
+    print(f"metrics written to {directory}/metrics.json and {directory}/metrics.prom")
 
 
 TARGET_DIR = "target"
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download gradescope assignments")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of assignments to fetch concurrently",
+    )
+    parser.add_argument(
+        "--render-jobs",
+        type=int,
+        help="number of processes rendering pdfs (default: one per cpu)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="at most this many gradescope requests per second "
+        "(default: 50, 0 for no limit)",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="cache gradescope pages in DIR and revalidate them on re-runs",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record",
+        metavar="FILE",
+        help="record every gradescope response (without cookies) to the cassette FILE",
+    )
+    cassette.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="serve gradescope responses from the cassette FILE, with no network",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="DIR",
+        help="write timings, byte and retry counts to DIR/metrics.json and DIR/metrics.prom",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="only save the assignments that failed in an earlier run",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="rebuild generated pdfs whose assignment outline has changed "
+        "(pdfs generated before outlines were fingerprinted are not checked; "
+        "delete them once to bring them under --sync)",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="check saved pdfs against their recorded hashes before saving",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    if args.rate is not None:
+        configure_rate_limit(rate=args.rate)
+    if args.cache:
+        enable_cache(args.cache)
+    if args.record:
+        enable_cassette(args.record, "record")
+    if args.replay:
+        enable_cassette(args.replay, "replay")
+
     print("Add your info in config.yaml and then edit main() at the bottom of main.py")
     # 1. Get all your courses
     # fetch_courses()
@@ -293,7 +937,20 @@ def main():
     # fetch_assignments()
 
     # 3. Save all your assignments
-    # save_assignments()
+    # if args.verify:
+    #     verify_outputs(jobs=args.jobs)
+    # save_assignments(
+    #     jobs=args.jobs,
+    #     retry_failed=args.retry_failed,
+    #     render_jobs=args.render_jobs,
+    #     sync=args.sync,
+    # )
+
+    # 4. Optionally, save every student's graded submission to an assignment
+    # save_submissions(course_id=123456, assignment_id=7654321, jobs=args.jobs)
+
+    if args.metrics:
+        write_metrics(args.metrics)
 
 
 if __name__ == "__main__":